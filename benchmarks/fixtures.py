@@ -0,0 +1,318 @@
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+RACE_DATE = date(2024, 6, 1)
+TODAYS_RACE_ID = 900000
+
+COURSES = ["Ascot", "Kempton", "Newmarket", "York", "Curragh", "Wolverhampton"]
+GOINGS = ["Good", "Good To Soft", "Soft", "Heavy", "Standard", "Good To Firm"]
+CONDITIONS = [
+    "3yo+ 0-85",
+    "4yo+ 0-100",
+    "2yo",
+    "3-5yo",
+    "Class 4 (0-80, 3yo+)",
+    "(0-60, 4yo+)",
+    "3yo+",
+    "Novices",
+]
+POSITIONS = ["1", "2", "3", "4", "5", "6", "7", "8", "PU", "F", "UR", "0"]
+BETTING_TYPES = [
+    "back_mid_price",
+    "back_outsider",
+    "back_outsider_place",
+    "lay_favourite",
+    "lay_mid_price_place",
+    "dutch_back",
+    "dutch_lay",
+]
+
+
+def performance_frame(
+    runners: int, max_runs: int, seed: int = 0, race_date: date = RACE_DATE
+) -> pd.DataFrame:
+    """
+    A todays_performance_data_mat_vw shaped frame for one race.
+
+    Each of the runners gets between 0 and max_runs historical rows spread
+    over the previous four years, followed by its row for today's race.
+    The dtypes match what BaseRepository.fetch_frame returns.
+    """
+    rng = np.random.default_rng(seed)
+    race_time = datetime.combine(race_date, datetime.min.time()) + timedelta(hours=14)
+    rows = []
+    for runner in range(runners):
+        horse_id = 1000 + runner * 10_000 + int(rng.integers(0, 10_000))
+        runs = int(rng.integers(0, max_runs + 1))
+        days_back = np.sort(rng.choice(np.arange(7, 365 * 4), runs, replace=False))
+        for back in days_back[::-1]:
+            rows.append(
+                _performance_row(
+                    rng,
+                    horse_id,
+                    race_id=100_000 + int(back),
+                    race_time=_race_time(rng, race_date - timedelta(days=int(back))),
+                    data_type="historical",
+                )
+            )
+        rows.append(
+            _performance_row(
+                rng,
+                horse_id,
+                race_id=TODAYS_RACE_ID,
+                race_time=race_time,
+                data_type="today",
+            )
+        )
+    return pd.DataFrame(rows)
+
+
+def anomalous_performance_frame(
+    runners: int, max_runs: int, seed: int = 0, race_date: date = RACE_DATE
+) -> pd.DataFrame:
+    """
+    performance_frame with one historical run dated after the run that
+    follows it, so race_date and race_time disagree on order and
+    TransformationService.calculate_horse_form falls back to the stage
+    pipeline.
+
+    No finishing position is "0", so the pipeline's fill value for the
+    shifted positions is not among the values the frame already holds.
+    """
+    data = performance_frame(runners, max_runs, seed, race_date)
+    data["finishing_position"] = data["finishing_position"].replace("0", "PU")
+    historical = data[data["data_type"] == "historical"]
+    horse_id = historical["horse_id"].value_counts().index[0]
+    first, second = historical.index[historical["horse_id"] == horse_id][:2]
+    data.loc[first, "race_date"] = data.loc[second, "race_date"] + timedelta(days=1)
+    return data
+
+
+def collateral_frame(runners: int, max_runs: int, seed: int = 0) -> pd.DataFrame:
+    """
+    A select_collateral_form_data_by_race_id shaped frame.
+
+    One race_form row per runner in the chosen race, and between 0 and
+    max_runs collateral rows for each of those runners afterwards.
+    """
+    rng = np.random.default_rng(seed)
+    race_date = RACE_DATE - timedelta(days=365)
+    rows = []
+    for runner in range(runners):
+        horse_id = 1000 + runner
+        distance_difference = float(rng.integers(-4, 5) * 110)
+        rows.append(
+            _collateral_row(
+                rng,
+                horse_id,
+                race_id=TODAYS_RACE_ID,
+                race_time=_race_time(rng, race_date),
+                distance_difference=distance_difference,
+                data_type="race_form",
+            )
+        )
+        runs = int(rng.integers(0, max_runs + 1))
+        days_after = np.sort(rng.choice(np.arange(1, 364), runs, replace=False))
+        for after in days_after:
+            rows.append(
+                _collateral_row(
+                    rng,
+                    horse_id,
+                    race_id=100_000 + int(after),
+                    race_time=_race_time(rng, race_date + timedelta(days=int(after))),
+                    distance_difference=distance_difference,
+                    data_type="collateral",
+                )
+            )
+    return pd.DataFrame(rows)
+
+
+def selections_frame(races: int, seed: int = 0) -> pd.DataFrame:
+    """
+    A settled betting.selections_info shaped frame ordered by created_at.
+
+    Betting types rotate per race and dutch bets cover two runners.
+    """
+    rng = np.random.default_rng(seed)
+    rows = []
+    for race in range(races):
+        betting_type = BETTING_TYPES[race % len(BETTING_TYPES)]
+        race_date = RACE_DATE - timedelta(days=races - race)
+        race_time = _race_time(rng, race_date)
+        created_at = datetime.combine(race_date, datetime.min.time()) + timedelta(
+            hours=10, seconds=race
+        )
+        for runner in range(2 if "dutch" in betting_type else 1):
+            row = _performance_row(
+                rng,
+                horse_id=1000 + race * 10 + runner,
+                race_id=100_000 + race,
+                race_time=race_time,
+                data_type="historical",
+            )
+            rows.append(
+                {
+                    "betting_type": betting_type,
+                    **row,
+                    "betfair_place_sp": float(
+                        np.round(row["betfair_win_sp"] / 3 + 1, 2)
+                    ),
+                    "price_move": float(np.round(row["betfair_win_sp"] * 0.1, 2)),
+                    "session_id": 1 + race // 60,
+                    "created_at": created_at,
+                }
+            )
+    return pd.DataFrame(rows)
+
+
+def recent_ratings_frame(horses: int, seed: int = 0) -> pd.DataFrame:
+    """
+    Combined speed figures and ratings of up to five recent runs per horse,
+    grouped by a sorted group_id, as calculate_horse_form takes medians of.
+    """
+    rng = np.random.default_rng(seed)
+    runs = rng.integers(0, 6, horses)
+    rows = int(runs.sum())
+    return pd.DataFrame(
+        {
+            "group_id": np.repeat(np.arange(horses), runs),
+            "speed_figure": rng.integers(15, 120, rows),
+            "rating": rng.integers(15, 140, rows),
+        }
+    )
+
+
+def _race_time(rng: np.random.Generator, race_date: date) -> datetime:
+    return datetime.combine(race_date, datetime.min.time()) + timedelta(
+        hours=int(rng.integers(12, 21)), minutes=int(rng.integers(0, 12)) * 5
+    )
+
+
+def _maybe(rng: np.random.Generator, value, missing: float = 0.15):
+    return None if rng.random() < missing else value
+
+
+def _performance_row(
+    rng: np.random.Generator,
+    horse_id: int,
+    race_id: int,
+    race_time: datetime,
+    data_type: str,
+) -> dict:
+    today = data_type == "today"
+    yards = float(rng.integers(10, 40) * 110)
+    price = float(np.round(rng.uniform(1.5, 60), 2))
+    course_id = int(rng.integers(0, len(COURSES)))
+    return {
+        "horse_name": f"Horse {horse_id}",
+        "horse_id": horse_id,
+        "age": int(rng.integers(2, 12)),
+        "horse_sex": "gelding",
+        "draw": _maybe(rng, int(rng.integers(1, 20))),
+        "headgear": _maybe(rng, "b", 0.7),
+        "weight_carried": "9-7",
+        "weight_carried_lbs": int(rng.integers(112, 140)),
+        "extra_weight": _maybe(rng, 3, 0.9),
+        "jockey_claim": _maybe(rng, 5, 0.9),
+        "finishing_position": None if today else str(rng.choice(POSITIONS)),
+        "total_distance_beaten": None if today else float(rng.uniform(0, 30)),
+        "industry_sp": "5/1",
+        "betfair_win_sp": price,
+        "betfair_place_sp": _maybe(rng, float(np.round(price / 3 + 1, 2))),
+        "price_change": _maybe(rng, float(rng.normal(0, 10))),
+        "official_rating": _maybe(rng, int(rng.integers(40, 120))),
+        "ts": None if today else _maybe(rng, int(rng.integers(0, 100)), 0.3),
+        "rpr": None if today else _maybe(rng, int(rng.integers(0, 130)), 0.3),
+        "tfr": None if today else _maybe(rng, int(rng.integers(0, 130)), 0.3),
+        "tfig": None if today else _maybe(rng, int(rng.integers(0, 100)), 0.3),
+        "in_play_high": _maybe(rng, 20.0),
+        "in_play_low": _maybe(rng, 1.5),
+        "in_race_comment": "held up",
+        "tf_comment": _maybe(rng, "ran on"),
+        "tfr_view": _maybe(rng, "+"),
+        "race_id": race_id,
+        "jockey_id": int(rng.integers(1, 300)),
+        "trainer_id": int(rng.integers(1, 300)),
+        "owner_id": int(rng.integers(1, 300)),
+        "sire_id": int(rng.integers(1, 300)),
+        "dam_id": int(rng.integers(1, 300)),
+        "unique_id": f"{race_id}-{horse_id}",
+        "race_time": race_time,
+        "race_date": race_time.date(),
+        "race_title": "Handicap",
+        "race_type": "Flat",
+        "race_class": 4 if today else _maybe(rng, int(rng.integers(1, 7))),
+        "distance": "1m",
+        "distance_yards": 1760.0 if today else yards,
+        "distance_meters": yards * 0.9144,
+        "distance_kilometers": yards * 0.0009144,
+        "conditions": "3yo+ 0-85" if today else str(rng.choice(CONDITIONS)),
+        "going": str(rng.choice(GOINGS)),
+        "number_of_runners": int(rng.integers(4, 20)),
+        "hcap_range": None,
+        "age_range": None,
+        "surface": "Turf",
+        "total_prize_money": int(rng.integers(3, 100)),
+        "first_place_prize_money": int(rng.integers(2, 60)),
+        "winning_time": "1m 40.2s",
+        "time_seconds": 100.2,
+        "relative_time": 0.5,
+        "relative_to_standard": "slow",
+        "country": "GB",
+        "main_race_comment": "comment",
+        "meeting_id": f"m{course_id}",
+        "course_id": course_id,
+        "course": COURSES[course_id],
+        "dam": "dam",
+        "sire": "sire",
+        "trainer": "trainer",
+        "jockey": "jockey",
+        "data_type": data_type,
+        "betfair_id": _maybe(rng, float(50_000 + horse_id), 0.05) if today else None,
+    }
+
+
+def _collateral_row(
+    rng: np.random.Generator,
+    horse_id: int,
+    race_id: int,
+    race_time: datetime,
+    distance_difference: Optional[float],
+    data_type: str,
+) -> dict:
+    return {
+        "horse_id": horse_id,
+        "horse_name": f"Horse {horse_id}",
+        "data_type": data_type,
+        "distance_difference": distance_difference,
+        "betfair_win_sp": float(np.round(rng.uniform(1.5, 60), 2)),
+        "official_rating": _maybe(rng, int(rng.integers(40, 120))),
+        "finishing_position": str(rng.choice(POSITIONS)),
+        "total_distance_beaten": float(rng.uniform(0, 30)),
+        "rating": np.nan,
+        "speed_figure": np.nan,
+        "unique_id": f"{race_id}-{horse_id}",
+        "race_id": race_id,
+        "race_time": race_time,
+        "race_date": race_time.date(),
+        "race_type": "Flat",
+        "race_class": _maybe(rng, int(rng.integers(1, 7))),
+        "distance": "1m",
+        "conditions": str(rng.choice(CONDITIONS)),
+        "going": str(rng.choice(GOINGS)),
+        "number_of_runners": int(rng.integers(4, 20)),
+        "surface": "Turf",
+        "main_race_comment": "comment",
+        "tf_comment": _maybe(rng, "ran on"),
+        "tfr_view": _maybe(rng, "+"),
+        "headgear": _maybe(rng, "b", 0.7),
+        "weight_carried": "9-7",
+        "draw": _maybe(rng, int(rng.integers(1, 20))),
+        "ts": _maybe(rng, int(rng.integers(0, 100)), 0.3),
+        "rpr": _maybe(rng, int(rng.integers(0, 130)), 0.3),
+        "tfr": _maybe(rng, int(rng.integers(0, 130)), 0.3),
+        "tfig": _maybe(rng, int(rng.integers(0, 100)), 0.3),
+    }
@@ -0,0 +1,333 @@
+"""
+Offline benchmarks for the hot paths, run against synthetic fixtures.
+
+    python -m benchmarks.run
+    python -m benchmarks.run --save baseline.json
+    python -m benchmarks.run --compare baseline.json --tolerance 0.25
+    python -m benchmarks.run --database-url postgresql+asyncpg://...
+
+Each case is timed over several repeats and then run once more under
+tracemalloc for its peak memory. With --compare the run exits non-zero
+when a case is slower or uses more memory than the baseline allows.
+
+With --database-url the small repository lookups are also timed against
+that database, once through COPY and once through the cached prepared
+statement, over a single session so the statement is reused.
+"""
+
+import argparse
+import asyncio
+import gc
+import json
+import statistics
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterator
+
+import pandas as pd
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+
+from src.repository.base_repository import BaseRepository
+from src.repository.frame_schema import PERFORMANCE_SCHEMA
+from src.services.base_service import BaseService
+from src.services.betting_service import BettingService
+from src.services.collateral_cache import collateral_cache
+from src.services.collateral_service import CollateralService
+from src.services.transformation_service import TransformationService
+
+from .fixtures import (
+    anomalous_performance_frame,
+    collateral_frame,
+    performance_frame,
+    recent_ratings_frame,
+    selections_frame,
+)
+
+RACE_RUNNERS_QUERY = """
+    SELECT pd.horse_id, pd.horse_name, h.bf_id::integer as betfair_id
+        FROM public.todays_performance_data_mat_vw pd
+        LEFT JOIN public.horse h
+        on h.id = pd.horse_id
+        WHERE pd.race_id = :race_id
+        AND pd.data_type = 'today'
+"""
+
+SIZES = {
+    "small": {"runners": 5, "max_runs": 20, "collateral_runs": 5, "races": 100},
+    "medium": {"runners": 14, "max_runs": 100, "collateral_runs": 15, "races": 1000},
+    "large": {"runners": 40, "max_runs": 300, "collateral_runs": 40, "races": 5000},
+}
+
+
+@dataclass
+class Result:
+    case: str
+    size: str
+    rows: int
+    median_ms: float
+    min_ms: float
+    calls_per_second: float
+    rows_per_second: float
+    peak_memory_mb: float
+
+
+class StubCollateralRepository:
+    def __init__(self, data: pd.DataFrame):
+        self.data = data
+
+    async def get_collateral_form_by_race_id(
+        self, race_date: str, race_id: int, todays_race_date: str
+    ) -> pd.DataFrame:
+        return self.data.copy()
+
+
+class StubBettingService(BettingService):
+    def _get_betting_session_id(self):
+        self.betting_session_id = 1
+
+
+def calculate_case(data: pd.DataFrame) -> Callable:
+    def run():
+        TransformationService.calculate(data.copy(), data["race_date"].max())
+
+    return run
+
+
+def horse_medians_case(data: pd.DataFrame) -> Callable:
+    group_ids = data["group_id"].to_numpy()
+    speed_figure = data["speed_figure"].to_numpy()
+    rating = data["rating"].to_numpy()
+    groups = int(group_ids.max()) + 1
+
+    def run():
+        TransformationService._horse_ratings(groups, group_ids, speed_figure, rating)
+
+    return run
+
+
+def horse_medians_groupby_case(data: pd.DataFrame) -> Callable:
+    def run():
+        data[["speed_figure", "rating"]].groupby(data["group_id"]).agg(
+            ["median", "mean"]
+        )
+
+    return run
+
+
+def format_todays_form_data_case(data: pd.DataFrame) -> Callable:
+    service = BaseService()
+
+    def run():
+        service.format_todays_form_data(data.copy(), TransformationService.calculate)
+
+    return run
+
+
+def collateral_case(data: pd.DataFrame) -> Callable:
+    service = CollateralService(StubCollateralRepository(data), TransformationService())
+
+    def run():
+        collateral_cache.frames.clear()
+        asyncio.run(
+            service.get_collateral_form_by_id("2023-06-01", 900000, "2024-06-01", 1)
+        )
+
+    return run
+
+
+def dutch_sum_case(data: pd.DataFrame) -> Callable:
+    service = StubBettingService(betting_repository=None)
+
+    def run():
+        service._calculate_dutch_sum(data.copy())
+
+    return run
+
+
+def fetch_case(
+    loop: asyncio.AbstractEventLoop,
+    repository: BaseRepository,
+    query: str,
+    params: dict,
+    prepared: bool,
+) -> Callable:
+    def run():
+        loop.run_until_complete(
+            repository.fetch_frame(query, params, prepared=prepared)
+        )
+
+    return run
+
+
+@contextmanager
+def database_cases(url: str) -> Iterator[list[tuple[str, pd.DataFrame, Callable]]]:
+    loop = asyncio.new_event_loop()
+    engine = create_async_engine(url)
+    session = AsyncSession(engine)
+    repository = BaseRepository(session)
+    race = loop.run_until_complete(
+        repository.fetch_frame(
+            """
+            SELECT race_id FROM public.todays_performance_data_mat_vw
+                WHERE data_type = 'today'
+                LIMIT 1
+            """
+        )
+    )
+    params = {"race_id": int(race["race_id"].iloc[0])}
+    runners = loop.run_until_complete(
+        repository.fetch_frame(RACE_RUNNERS_QUERY, params)
+    )
+    try:
+        yield [
+            (
+                "get_race_runners_copy",
+                runners,
+                fetch_case(loop, repository, RACE_RUNNERS_QUERY, params, False),
+            ),
+            (
+                "get_race_runners",
+                runners,
+                fetch_case(loop, repository, RACE_RUNNERS_QUERY, params, True),
+            ),
+        ]
+    finally:
+        loop.run_until_complete(session.close())
+        loop.run_until_complete(engine.dispose())
+        loop.close()
+
+
+def cases(size: str) -> list[tuple[str, pd.DataFrame, Callable]]:
+    params = SIZES[size]
+    performance = PERFORMANCE_SCHEMA.apply(
+        performance_frame(params["runners"], params["max_runs"])
+    )
+    anomalous = PERFORMANCE_SCHEMA.apply(
+        anomalous_performance_frame(params["runners"], params["max_runs"])
+    )
+    collateral = collateral_frame(params["runners"], params["collateral_runs"])
+    selections = selections_frame(params["races"])
+    recent_ratings = recent_ratings_frame(params["races"] * 10)
+    return [
+        ("calculate", performance, calculate_case(performance)),
+        ("calculate_pipeline", anomalous, calculate_case(anomalous)),
+        ("horse_medians", recent_ratings, horse_medians_case(recent_ratings)),
+        (
+            "horse_medians_groupby",
+            recent_ratings,
+            horse_medians_groupby_case(recent_ratings),
+        ),
+        (
+            "format_todays_form_data",
+            performance,
+            format_todays_form_data_case(performance),
+        ),
+        ("get_collateral_form_by_id", collateral, collateral_case(collateral)),
+        ("_calculate_dutch_sum", selections, dutch_sum_case(selections)),
+    ]
+
+
+def measure(case: str, size: str, rows: int, run: Callable, repeat: int) -> Result:
+    run()
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        started = time.perf_counter()
+        run()
+        timings.append(time.perf_counter() - started)
+
+    gc.collect()
+    tracemalloc.start()
+    run()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    median = statistics.median(timings)
+    return Result(
+        case=case,
+        size=size,
+        rows=rows,
+        median_ms=round(median * 1000, 2),
+        min_ms=round(min(timings) * 1000, 2),
+        calls_per_second=round(1 / median, 2),
+        rows_per_second=round(rows / median),
+        peak_memory_mb=round(peak / 2**20, 2),
+    )
+
+
+def regressions(
+    results: list[Result], baseline: list[dict], tolerance: float
+) -> list[str]:
+    previous = {(b["case"], b["size"]): b for b in baseline}
+    failures = []
+    for result in results:
+        before = previous.get((result.case, result.size))
+        if before is None:
+            continue
+        for metric in ["median_ms", "peak_memory_mb"]:
+            limit = before[metric] * (1 + tolerance)
+            if getattr(result, metric) > limit:
+                failures.append(
+                    f"{result.case} [{result.size}] {metric}: "
+                    f"{getattr(result, metric)} > {before[metric]} (+{tolerance:.0%})"
+                )
+    return failures
+
+
+def report(results: list[Result]) -> None:
+    header = (
+        f"{'case':<26}{'size':<8}{'rows':>8}{'median ms':>12}{'min ms':>10}"
+        f"{'calls/s':>10}{'rows/s':>12}{'peak MB':>10}"
+    )
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r.case:<26}{r.size:<8}{r.rows:>8}{r.median_ms:>12.2f}{r.min_ms:>10.2f}"
+            f"{r.calls_per_second:>10.2f}{r.rows_per_second:>12}{r.peak_memory_mb:>10.2f}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", nargs="+", choices=SIZES, default=list(SIZES))
+    parser.add_argument("--cases", nargs="+")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="write the results to this JSON file")
+    parser.add_argument("--compare", help="baseline JSON file to check against")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--database-url", help="also time the database lookups")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        for case, data, run in cases(size):
+            if args.cases and case not in args.cases:
+                continue
+            results.append(measure(case, size, len(data), run, args.repeat))
+    if args.database_url:
+        with database_cases(args.database_url) as db_cases:
+            for case, data, run in db_cases:
+                if args.cases and case not in args.cases:
+                    continue
+                results.append(measure(case, "db", len(data), run, args.repeat))
+    report(results)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            failures = regressions(results, json.load(f), args.tolerance)
+        for failure in failures:
+            print(f"REGRESSION {failure}", file=sys.stderr)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,5 +1,6 @@
 import asyncio
 import json
+from contextlib import asynccontextmanager
 
 import uvicorn
 from fastapi import FastAPI
@@ -8,14 +9,56 @@ from starlette_context.middleware import RawContextMiddleware
 
 from src.controllers.betting_api import router as BettingAPIRouter
 from src.controllers.collateral_api import router as CollateralAPIRouter
+from src.controllers.diagnostics_api import router as DiagnosticsAPIRouter
 from src.controllers.feedback_api import router as FeedbackAPIRouter
 from src.controllers.todays_api import router as TodaysAPIRouter
+from src.config import config
+from src.helpers.background_tasks import run_periodically
+from src.helpers.session_manager import warm_up_pool
 from src.helpers.sql_db import get_db
+from src.helpers.worker_pool import worker_pool
 from src.middlewares.db_session import DBSessionMiddleware
+from src.middlewares.timing import TimingMiddleware
+from src.repository.history_store import sync_history_stores
+from src.repository.prices_repository import refresh_prices
+from src.repository.view_versions import refresh_view_versions
+from src.services.todays_service import refresh_race_card_cache
 
 API_PREFIX_V1 = "/racing-api/api/v1"
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await asyncio.gather(warm_up_pool(), worker_pool.warm_up())
+    tasks = [
+        asyncio.create_task(
+            run_periodically(
+                refresh_race_card_cache, config.race_card_refresh_interval
+            )
+        ),
+        asyncio.create_task(
+            run_periodically(refresh_prices, config.prices_refresh_interval)
+        ),
+        asyncio.create_task(
+            run_periodically(
+                refresh_view_versions, config.view_version_refresh_interval
+            )
+        ),
+    ]
+    if config.history_store_path is not None:
+        tasks.append(
+            asyncio.create_task(
+                run_periodically(
+                    sync_history_stores, config.history_store_sync_interval
+                )
+            )
+        )
+    yield
+    for task in tasks:
+        task.cancel()
+    worker_pool.shutdown()
+
+
 def create_app() -> FastAPI:
     openapi_url = "/users-api/openapi.json"
     docs_url = "/users-api/docs"
@@ -25,10 +68,12 @@ def create_app() -> FastAPI:
         version="0.1.0",
         openapi_url=openapi_url,
         docs_url=docs_url,
+        lifespan=lifespan,
     )
 
     app.add_middleware(RawContextMiddleware)
     app.add_middleware(DBSessionMiddleware)
+    app.add_middleware(TimingMiddleware)
     app.add_middleware(
         CORSMiddleware,
         allow_origins=["*"],  # List the URL(s) of your frontend app
@@ -43,6 +88,7 @@ def create_app() -> FastAPI:
     app.include_router(TodaysAPIRouter, prefix=API_PREFIX_V1)
     app.include_router(CollateralAPIRouter, prefix=API_PREFIX_V1)
     app.include_router(BettingAPIRouter, prefix=API_PREFIX_V1)
+    app.include_router(DiagnosticsAPIRouter, prefix=API_PREFIX_V1)
     return app
 
 
@@ -1,4 +1,5 @@
 import os
+from typing import Optional
 
 from dotenv import load_dotenv
 from pydantic_settings import BaseSettings
@@ -25,6 +26,20 @@ class Config(BaseSettings):
     do_spaces_secret_access_key: str
     do_spaces_bucket_name: str
     do_spaces_region_name: str
+    race_card_refresh_interval: int = 60
+    prices_refresh_interval: int = 5
+    prices_ttl: int = 15
+    collateral_cache_size: int = 4096
+    transformation_workers: int = 2
+    history_store_path: Optional[str] = None
+    history_store_partitions: int = 64
+    history_store_sync_interval: int = 300
+    feedback_snapshot_path: Optional[str] = None
+    feedback_snapshot_days: int = 30
+    db_statement_cache_size: int = 100
+    view_version_refresh_interval: int = 5
+    betting_ledger_path: str = "betting_ledger"
+    prices_full_listing_interval: int = 60
 
 
 def load_config() -> Config:
@@ -1,10 +1,24 @@
-from fastapi import APIRouter, Depends
+from datetime import date
+from typing import List, Optional
 
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from ..helpers.serialization import (
+    NDJSON,
+    EncodedJSONResponse,
+    preferred_media_type,
+)
 from ..models.betting_selections import (
     BettingSelections,
     BettingSelectionsAnalysisResponse,
+    BettingSelectionsFilter,
+)
+from ..services.betting_service import (
+    BettingService,
+    decode_cursor,
+    get_betting_service,
 )
-from ..services.betting_service import BettingService, get_betting_service
 
 router = APIRouter()
 
@@ -17,8 +31,40 @@ async def store_betting_selections(
     return await service.store_betting_selections(selections)
 
 
-@router.get("/betting/selections_analysis")
+@router.get(
+    "/betting/selections_analysis",
+    response_model=BettingSelectionsAnalysisResponse,
+    responses={200: {"content": {NDJSON: {}}}},
+)
 async def get_betting_selections_analysis(
+    betting_type: List[str] = Query(default=[]),
+    session_id: Optional[int] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    cursor: Optional[str] = None,
+    limit: Optional[int] = Query(default=None, ge=1),
+    accept: Optional[str] = Header(default=None),
     service: BettingService = Depends(get_betting_service),
-) -> BettingSelectionsAnalysisResponse:
-    return await service.get_betting_selections_analysis()
+):
+    try:
+        filters = BettingSelectionsFilter(
+            betting_types=betting_type,
+            session_id=session_id,
+            date_from=date_from,
+            date_to=date_to,
+            cursor=None if cursor is None else decode_cursor(cursor),
+            limit=limit,
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if preferred_media_type(accept, [NDJSON]) == NDJSON:
+        return StreamingResponse(
+            await service.stream_betting_selections_analysis(filters),
+            media_type=NDJSON,
+            headers={"Vary": "Accept"},
+        )
+    return EncodedJSONResponse(
+        await service.get_betting_selections_analysis(filters),
+        headers={"Vary": "Accept"},
+    )
@@ -1,5 +1,6 @@
 from fastapi import APIRouter, Depends
 
+from ..helpers.serialization import EncodedJSONResponse
 from ..models.collateral_form_data import CollateralFormResponse
 from ..services.collateral_service import CollateralService, get_collateral_service
 
@@ -14,9 +15,11 @@ async def get_collateral_form_by_id(
     horse_id: int,
     service: CollateralService = Depends(get_collateral_service),
 ):
-    return await service.get_collateral_form_by_id(
-        race_date=race_date,
-        race_id=race_id,
-        todays_race_date=todays_race_date,
-        horse_id=horse_id,
+    return EncodedJSONResponse(
+        await service.get_collateral_form_by_id(
+            race_date=race_date,
+            race_id=race_id,
+            todays_race_date=todays_race_date,
+            horse_id=horse_id,
+        )
     )
@@ -0,0 +1,31 @@
+from fastapi import APIRouter
+
+from ..helpers.session_manager import engine
+from ..helpers.sql_db import pool_metrics
+from ..helpers.timing import request_timings
+from ..repository.base_repository import statement_cache
+
+router = APIRouter()
+
+
+@router.get("/diagnostics/timings")
+async def get_request_timings():
+    return request_timings.to_dict()
+
+
+@router.delete("/diagnostics/timings")
+async def clear_request_timings():
+    request_timings.clear()
+
+
+@router.get("/diagnostics/pool")
+async def get_pool_metrics():
+    return {
+        **pool_metrics.to_dict(engine.sync_engine.pool),
+        "prepared_statements": statement_cache.to_dict(),
+    }
+
+
+@router.delete("/diagnostics/pool")
+async def clear_pool_metrics():
+    pool_metrics.clear()
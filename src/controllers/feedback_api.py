@@ -1,11 +1,16 @@
-from typing import List
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
 
+from ..helpers.arrow import TABLE_RESPONSES, table_media_type, table_response
+from ..helpers.conditional import cache_headers, etag_matches, not_modified
+from ..helpers.serialization import EncodedJSONResponse
 from ..models.feedback_date import DateRequest, TodaysFeedbackDateResponse
 from ..models.feedback_result import TodaysRacesResultResponse
-from ..models.form_data import TodaysRaceFormData
+from ..models.form_data import TodaysHorseFormPage, TodaysRaceFormData
 from ..models.todays_race_times import TodaysRacesResponse
+from ..repository.view_versions import view_versions
+from ..services.base_service import decode_runs_cursor
 from ..services.feedback_service import FeedbackService, get_feedback_service
 
 router = APIRouter()
@@ -46,12 +51,56 @@ async def get_todays_races(
     return await feedback_service.get_todays_races()
 
 
-@router.get("/feedback/todays-races/by-race-id", response_model=TodaysRaceFormData)
+@router.get(
+    "/feedback/todays-races/by-race-id",
+    response_model=TodaysRaceFormData,
+    responses=TABLE_RESPONSES,
+)
 async def get_race_by_id_and_date(
     race_id: int,
+    runs: Optional[int] = Query(default=None, ge=1),
+    accept: Optional[str] = Header(default=None),
+    if_none_match: Optional[str] = Header(default=None),
+    feedback_service: FeedbackService = Depends(get_feedback_service),
+):
+    media_type = table_media_type(accept)
+    etag = view_versions.feedback_tag("race", race_id, media_type, runs)
+    if etag is not None and etag_matches(if_none_match, etag):
+        return not_modified(etag, {"Vary": "Accept"})
+    if media_type is not None:
+        response = table_response(
+            await feedback_service.get_race_table_by_id(race_id, media_type),
+            media_type,
+            filename=f"feedback_race_{race_id}",
+        )
+        response.headers.update(cache_headers(etag))
+        return response
+    return EncodedJSONResponse(
+        await feedback_service.get_race_by_id(race_id=race_id, runs=runs),
+        headers=cache_headers(etag, {"Vary": "Accept"}),
+    )
+
+
+@router.get("/feedback/todays-races/horse-form", response_model=TodaysHorseFormPage)
+async def get_horse_form(
+    race_id: int,
+    horse_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=10, ge=1),
     feedback_service: FeedbackService = Depends(get_feedback_service),
 ):
-    return await feedback_service.get_race_by_id(race_id=race_id)
+    try:
+        runs_cursor = None if cursor is None else decode_runs_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    horse_form = await feedback_service.get_horse_form(
+        race_id, horse_id, runs_cursor, limit
+    )
+    if horse_form is None:
+        raise HTTPException(
+            status_code=404, detail=f"Horse {horse_id} not found in race {race_id}"
+        )
+    return EncodedJSONResponse(horse_form)
 
 
 @router.get(
@@ -60,6 +109,12 @@ async def get_race_by_id_and_date(
 )
 async def get_race_result_by_id_and_date(
     race_id: int,
+    response: Response,
+    if_none_match: Optional[str] = Header(default=None),
     feedback_service: FeedbackService = Depends(get_feedback_service),
 ):
+    etag = view_versions.feedback_tag("result", race_id)
+    if etag is not None and etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
     return await feedback_service.get_race_result_by_id(race_id=race_id)
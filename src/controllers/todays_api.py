@@ -1,9 +1,15 @@
-from typing import List
+from datetime import datetime
+from typing import List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 
-from ..models.form_data import TodaysRaceFormData
+from ..helpers.arrow import TABLE_RESPONSES, table_media_type, table_response
+from ..helpers.conditional import cache_headers, etag_matches, not_modified
+from ..helpers.serialization import EncodedJSONResponse
+from ..models.form_data import TodaysHorseFormPage, TodaysRaceFormData
 from ..models.todays_race_times import TodaysRacesResponse
+from ..services.base_service import decode_runs_cursor
 from ..services.todays_service import TodaysService, get_todays_service
 
 router = APIRouter()
@@ -11,14 +17,94 @@ router = APIRouter()
 
 @router.get("/today/todays-races/by-date", response_model=List[TodaysRacesResponse])
 async def get_todays_races(
+    response: Response,
+    if_none_match: Optional[str] = Header(default=None),
     today_service: TodaysService = Depends(get_todays_service),
 ):
-    return await today_service.get_todays_races()
+    await today_service.sync_todays_races_index()
+    now = datetime.now()
+    etag = today_service.todays_races_tag(now)
+    if etag is not None and etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers.update(cache_headers(etag))
+    return today_service.get_todays_races(now)
 
 
-@router.get("/today/todays-races/by-race-id", response_model=TodaysRaceFormData)
+@router.get(
+    "/today/todays-races/by-race-id",
+    response_model=TodaysRaceFormData,
+    responses=TABLE_RESPONSES,
+)
 async def get_race_by_id(
     race_id: int,
+    runs: Optional[int] = Query(default=None, ge=1),
+    accept: Optional[str] = Header(default=None),
     today_service: TodaysService = Depends(get_todays_service),
 ):
-    return await today_service.get_race_by_id(race_id=race_id)
+    media_type = table_media_type(accept)
+    if media_type is not None:
+        return table_response(
+            await today_service.get_race_table_by_id(race_id, media_type),
+            media_type,
+            filename=f"race_{race_id}",
+        )
+    return EncodedJSONResponse(
+        await today_service.get_race_by_id(race_id=race_id, runs=runs),
+        headers={"Vary": "Accept"},
+    )
+
+
+@router.get("/today/todays-races/horse-form", response_model=TodaysHorseFormPage)
+async def get_horse_form(
+    race_id: int,
+    horse_id: int,
+    cursor: Optional[str] = None,
+    limit: int = Query(default=10, ge=1),
+    today_service: TodaysService = Depends(get_todays_service),
+):
+    try:
+        runs_cursor = None if cursor is None else decode_runs_cursor(cursor)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    horse_form = await today_service.get_horse_form(
+        race_id, horse_id, runs_cursor, limit
+    )
+    if horse_form is None:
+        raise HTTPException(
+            status_code=404, detail=f"Horse {horse_id} not found in race {race_id}"
+        )
+    return EncodedJSONResponse(horse_form)
+
+
+@router.get("/today/todays-races/prices-stream")
+async def stream_race_prices(
+    race_id: int,
+    today_service: TodaysService = Depends(get_todays_service),
+):
+    runners = await today_service.get_race_runners(race_id)
+    if runners.empty:
+        raise HTTPException(status_code=404, detail=f"Race {race_id} not found")
+    return StreamingResponse(
+        today_service.stream_race_prices(race_id, runners),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@router.get("/today/todays-races/race-cards")
+async def get_race_cards(
+    race_ids: List[int] = Query(default=[]),
+    course_id: Optional[int] = None,
+    runs: Optional[int] = Query(default=None, ge=1),
+    today_service: TodaysService = Depends(get_todays_service),
+):
+    if not race_ids and course_id is None:
+        raise HTTPException(
+            status_code=400, detail="Either race_ids or course_id is required"
+        )
+
+    race_cards = await today_service.get_race_cards(race_ids, course_id, runs)
+    return StreamingResponse(
+        (race_card + b"\n" for race_card in race_cards),
+        media_type="application/x-ndjson",
+    )
@@ -0,0 +1,107 @@
+from datetime import date, datetime
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from .serialization import _scalar_type, dumps, preferred_media_type
+from .timing import timed
+
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+PARQUET = "application/vnd.apache.parquet"
+TABLE_MEDIA_TYPES = [ARROW_STREAM, PARQUET]
+TABLE_RESPONSES = {200: {"content": {ARROW_STREAM: {}, PARQUET: {}}}}
+
+
+def table_media_type(accept: Optional[str]) -> Optional[str]:
+    """Pick Arrow IPC or Parquet from an Accept header, or None for JSON."""
+    return preferred_media_type(accept, TABLE_MEDIA_TYPES)
+
+
+def _int_array(column: pd.Series) -> pa.Array:
+    values = pd.to_numeric(column, errors="coerce")
+    if not pd.api.types.is_integer_dtype(values):
+        values = np.trunc(values.astype("float64"))
+    return pa.array(values.astype("Int64"), type=pa.int64())
+
+
+def _float_array(column: pd.Series) -> pa.Array:
+    values = pd.to_numeric(column, errors="coerce").astype("float64")
+    return pa.array(values.to_numpy(), type=pa.float64(), from_pandas=True)
+
+
+def _datetime_array(column: pd.Series) -> pa.Array:
+    values = pd.to_datetime(column).dt.tz_localize(None)
+    return pa.array(
+        values.to_numpy(dtype="datetime64[us]"), type=pa.timestamp("us"), from_pandas=True
+    )
+
+
+def _date_array(column: pd.Series) -> pa.Array:
+    values = pd.to_datetime(column).to_numpy(dtype="datetime64[D]")
+    return pa.array(values, type=pa.date32(), from_pandas=True)
+
+
+def _string_array(column: pd.Series) -> pa.Array:
+    values = column.astype(object)
+    values = values.where(values.isna(), values.astype(str))
+    return pa.array(values.to_numpy(), type=pa.string(), from_pandas=True)
+
+
+def _bool_array(column: pd.Series) -> pa.Array:
+    return pa.array(column.astype(object).to_numpy(), type=pa.bool_(), from_pandas=True)
+
+
+ARRAY_CONVERTERS = {
+    bool: (_bool_array, pa.bool_()),
+    int: (_int_array, pa.int64()),
+    float: (_float_array, pa.float64()),
+    datetime: (_datetime_array, pa.timestamp("us")),
+    date: (_date_array, pa.date32()),
+    str: (_string_array, pa.string()),
+}
+
+
+def frame_table(
+    data: pd.DataFrame, models: list[type[BaseModel]], header: dict
+) -> pa.Table:
+    """
+    Build an Arrow table from the scalar fields of ``models``.
+
+    Columns are typed from the model annotations the same way frame_records
+    converts them for JSON, and ``header`` is stored as JSON under the
+    "header" key of the schema metadata.
+    """
+    arrays = {}
+    for model in models:
+        for name, field in model.model_fields.items():
+            converter = ARRAY_CONVERTERS.get(_scalar_type(field.annotation))
+            if converter is None or name in arrays:
+                continue
+            to_array, arrow_type = converter
+            arrays[name] = (
+                to_array(data[name]) if name in data else pa.nulls(len(data), arrow_type)
+            )
+    return pa.table(arrays, metadata={"header": dumps(header)})
+
+
+@timed("encode")
+def encode_table(table: pa.Table, media_type: str) -> bytes:
+    sink = pa.BufferOutputStream()
+    if media_type == PARQUET:
+        pq.write_table(table, sink)
+    else:
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def table_response(content: bytes, media_type: str, filename: str) -> Response:
+    headers = {"Vary": "Accept"}
+    if media_type == PARQUET:
+        headers["Content-Disposition"] = f'attachment; filename="{filename}.parquet"'
+    return Response(content, media_type=media_type, headers=headers)
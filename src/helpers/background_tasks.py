@@ -0,0 +1,17 @@
+import asyncio
+from typing import Awaitable, Callable
+
+from .logging_config import logger
+
+
+async def run_periodically(
+    job: Callable[[], Awaitable], interval_seconds: float
+) -> None:
+    while True:
+        try:
+            await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception as error:
+            logger.exception(error)
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,41 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Response, status
+
+CACHE_CONTROL = "no-cache"
+
+
+def entity_tag(*parts) -> str:
+    """A strong ETag for a response identified by the given parts."""
+    digest = hashlib.blake2b(
+        "\x1f".join(str(part) for part in parts).encode(), digest_size=16
+    )
+    return f'"{digest.hexdigest()}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if if_none_match is None:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in (tag.removeprefix("W/") for tag in tags)
+
+
+def cache_headers(
+    etag: Optional[str], headers: Optional[dict[str, str]] = None
+) -> dict[str, str]:
+    """
+    ETag and Cache-Control added to a response's headers, left out while
+    no version is known for the data behind it.
+    """
+    headers = dict(headers or {})
+    if etag is not None:
+        headers.update({"ETag": etag, "Cache-Control": CACHE_CONTROL})
+    return headers
+
+
+def not_modified(etag: str, headers: Optional[dict[str, str]] = None) -> Response:
+    return Response(
+        status_code=status.HTTP_304_NOT_MODIFIED,
+        headers=cache_headers(etag, headers),
+    )
@@ -1,8 +1,12 @@
+from functools import lru_cache
+
+import boto3
 from api_helpers.s3_client import S3Client, S3Connection
 
 from src.config import Config
 
 
+@lru_cache
 def get_s3_client():
     config = Config()
     return S3Client(
@@ -14,3 +18,15 @@ def get_s3_client():
             bucket_name=config.do_spaces_bucket_name,
         )
     )
+
+
+@lru_cache
+def get_s3_object_client():
+    config = Config()
+    return boto3.session.Session().client(
+        "s3",
+        aws_access_key_id=config.do_spaces_access_key,
+        aws_secret_access_key=config.do_spaces_secret_access_key,
+        region_name=config.do_spaces_region_name,
+        endpoint_url=config.do_spaces_endpoint_url,
+    )
@@ -0,0 +1,148 @@
+import types
+from datetime import date, datetime
+from typing import Any, Optional, Union, get_args, get_origin
+
+import numpy as np
+import orjson
+import pandas as pd
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+from .timing import timed
+
+JSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+NDJSON = "application/x-ndjson"
+
+
+def _json_default(value: Any) -> Any:
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+@timed("serialize")
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_json_default, option=JSON_OPTIONS)
+
+
+def dumps_lines(records: list) -> bytes:
+    """Encode each record as one line of newline delimited JSON."""
+    return b"".join(
+        orjson.dumps(
+            record,
+            default=_json_default,
+            option=JSON_OPTIONS | orjson.OPT_APPEND_NEWLINE,
+        )
+        for record in records
+    )
+
+
+def preferred_media_type(
+    accept: Optional[str], media_types: list[str]
+) -> Optional[str]:
+    """
+    Pick one of ``media_types`` from an Accept header, or None for JSON.
+
+    Media ranges are tried in order of their q value, and JSON or a
+    wildcard ranked above the given types keeps the JSON response.
+    """
+    if not accept:
+        return None
+    ranges = []
+    for position, media_range in enumerate(accept.split(",")):
+        media_type, *params = [part.strip() for part in media_range.split(";")]
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            ranges.append((-quality, position, media_type.lower()))
+    for _, _, media_type in sorted(ranges):
+        if media_type in media_types:
+            return media_type
+        if media_type in ("application/json", "application/*", "*/*"):
+            return None
+    return None
+
+
+class EncodedJSONResponse(Response):
+    """JSON response that accepts already encoded bytes as its content."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
+
+
+def _scalar_type(annotation: Any) -> Optional[type]:
+    if get_origin(annotation) in (Union, types.UnionType):
+        annotation = next(
+            arg for arg in get_args(annotation) if arg is not type(None)
+        )
+    return annotation if isinstance(annotation, type) else None
+
+
+def _int_values(column: pd.Series) -> list:
+    values = pd.to_numeric(column, errors="coerce")
+    if pd.api.types.is_integer_dtype(values):
+        return values.astype(object).where(values.notna(), None).tolist()
+    return [None if v != v else int(v) for v in values.astype("float64").tolist()]
+
+
+def _float_values(column: pd.Series) -> list:
+    return pd.to_numeric(column, errors="coerce").astype("float64").tolist()
+
+
+def _datetime_values(column: pd.Series) -> list:
+    values = pd.to_datetime(column).dt.tz_localize(None)
+    return values.to_numpy(dtype="datetime64[us]").astype(object).tolist()
+
+
+def _date_values(column: pd.Series) -> list:
+    values = pd.to_datetime(column)
+    return values.to_numpy(dtype="datetime64[D]").astype(object).tolist()
+
+
+def _object_values(column: pd.Series) -> list:
+    return column.astype(object).where(column.notna(), None).tolist()
+
+
+CONVERTERS = {
+    bool: _object_values,
+    int: _int_values,
+    float: _float_values,
+    datetime: _datetime_values,
+    date: _date_values,
+    str: _object_values,
+}
+
+
+def frame_records(data: pd.DataFrame, model: type[BaseModel]) -> list[dict]:
+    """
+    Convert a DataFrame to JSON ready records holding the scalar fields of
+    ``model``.
+
+    Each field is converted a whole column at a time to the type declared on
+    the model, with missing values as None, so the records can be encoded
+    directly without validating them through the model. Nested fields are
+    left for the caller to fill in.
+    """
+    columns = {}
+    for name, field in model.model_fields.items():
+        converter = CONVERTERS.get(_scalar_type(field.annotation))
+        if converter is None:
+            continue
+        columns[name] = (
+            converter(data[name]) if name in data else [None] * len(data)
+        )
+    return [dict(zip(columns, values)) for values in zip(*columns.values())]
@@ -1,6 +1,9 @@
+import asyncio
+from contextlib import asynccontextmanager
 from contextvars import ContextVar
-from typing import Optional
+from typing import AsyncIterator, Optional
 
+from sqlalchemy import text
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     async_scoped_session,
@@ -8,6 +11,7 @@ from sqlalchemy.ext.asyncio import (
 )
 
 from ..config import config, db_url
+from ..helpers.logging_config import logger
 from ..helpers.sql_db import get_engine
 
 engine = get_engine(db_url, config)
@@ -35,3 +39,29 @@ AsyncScopedSession = async_scoped_session(
 
 def get_current_session() -> AsyncSession:
     return AsyncScopedSession()
+
+
+@asynccontextmanager
+async def background_session() -> AsyncIterator[AsyncSession]:
+    set_db_session_context(session_id=id(asyncio.current_task()))
+    try:
+        yield get_current_session()
+    finally:
+        await AsyncScopedSession.remove()
+        set_db_session_context(session_id=None)
+
+
+async def warm_up_pool() -> None:
+    """
+    Open every pooled connection up front so the first requests after
+    startup do not pay for connecting.
+    """
+
+    async def connect():
+        async with engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    try:
+        await asyncio.gather(*[connect() for _ in range(config.db_pool_size)])
+    except Exception as error:
+        logger.warning(f"Connection pool warm up failed: {error}")
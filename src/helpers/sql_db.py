@@ -1,12 +1,65 @@
 # db_config.py
 
 import json
+import time
 
 import pydantic.json
 from api_helpers.postgres_client import PsqlConnection, PostgresClient
+from sqlalchemy import exc
 from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 
 from src.config import Config
+from src.helpers.timing import StageHistogram
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self.pending = 0
+        self.max_pending = 0
+        self.checkouts = 0
+        self.timeouts = 0
+        self.wait = StageHistogram()
+
+    def to_dict(self, pool: AsyncAdaptedQueuePool) -> dict:
+        return {
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "pending": self.pending,
+            "max_pending": self.max_pending,
+            "checkouts": self.checkouts,
+            "timeouts": self.timeouts,
+            "wait": self.wait.to_dict(),
+        }
+
+
+pool_metrics = PoolMetrics()
+
+
+class MonitoredPool(AsyncAdaptedQueuePool):
+    """
+    Queue pool that counts the callers waiting for a connection and records
+    how long each checkout took, including any pre-ping or new connection.
+    """
+
+    def connect(self):
+        pool_metrics.pending += 1
+        pool_metrics.max_pending = max(pool_metrics.max_pending, pool_metrics.pending)
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            pool_metrics.pending -= 1
+            pool_metrics.wait.add((time.perf_counter() - started) * 1000)
+        pool_metrics.checkouts += 1
+        return connection
 
 
 def get_engine(db_url, config: Config):
@@ -15,11 +68,16 @@ def get_engine(db_url, config: Config):
         json_serializer=lambda *args, **kwargs: json.dumps(
             *args, default=pydantic.json.pydantic_encoder, **kwargs
         ),
+        poolclass=MonitoredPool,
         pool_size=config.db_pool_size,
         max_overflow=0,
+        pool_timeout=config.db_conn_timeout,
+        pool_pre_ping=True,
         connect_args={
             "command_timeout": config.db_query_timeout,
             "timeout": config.db_conn_timeout,
+            "statement_cache_size": config.db_statement_cache_size,
+            "prepared_statement_cache_size": config.db_statement_cache_size,
         },
     )
 
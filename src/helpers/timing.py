@@ -0,0 +1,103 @@
+import bisect
+import heapq
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+BUCKETS_MS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+SLOWEST_REQUESTS = 20
+
+stage_timings: ContextVar[Optional[list[tuple[str, float]]]] = ContextVar(
+    "stage_timings", default=None
+)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record the duration of a stage against the current request, if any."""
+    timings = stage_timings.get()
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.append((stage, (time.perf_counter() - started) * 1000))
+
+
+def summarise_stages(timings: list[tuple[str, float]]) -> dict[str, float]:
+    stages: dict[str, float] = {}
+    for stage, duration in timings:
+        stages[stage] = stages.get(stage, 0.0) + duration
+    return stages
+
+
+def server_timing_header(stages: dict[str, float]) -> str:
+    return ", ".join(f"{stage};dur={duration:.1f}" for stage, duration in stages.items())
+
+
+class StageHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS_MS) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, duration: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS_MS, duration)] += 1
+        self.count += 1
+        self.total_ms += duration
+        self.max_ms = max(self.max_ms, duration)
+
+    def to_dict(self) -> dict:
+        labels = [f"le_{bucket}" for bucket in BUCKETS_MS] + ["inf"]
+        return {
+            "count": self.count,
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else 0,
+            "max_ms": round(self.max_ms, 2),
+            "buckets": dict(zip(labels, self.counts)),
+        }
+
+
+class RequestTimings:
+    def __init__(self):
+        self.clear()
+
+    def clear(self) -> None:
+        self.histograms: dict[str, dict[str, StageHistogram]] = defaultdict(
+            lambda: defaultdict(StageHistogram)
+        )
+        self.slowest: list[tuple[float, int, dict]] = []
+        self.requests = 0
+
+    def record(self, route: str, target: str, stages: dict[str, float]) -> None:
+        for stage, duration in stages.items():
+            self.histograms[route][stage].add(duration)
+        self.requests += 1
+        request = {"route": route, "target": target, "stages": stages}
+        entry = (stages.get("total", 0.0), self.requests, request)
+        if len(self.slowest) < SLOWEST_REQUESTS:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+    def to_dict(self) -> dict:
+        return {
+            "routes": {
+                route: {stage: h.to_dict() for stage, h in stages.items()}
+                for route, stages in self.histograms.items()
+            },
+            "slowest": [
+                {
+                    **request,
+                    "stages": {k: round(v, 2) for k, v in request["stages"].items()},
+                }
+                for _, _, request in sorted(self.slowest, reverse=True)
+            ],
+        }
+
+
+request_timings = RequestTimings()
@@ -0,0 +1,165 @@
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+from typing import Any, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+from ..config import config
+from .timing import stage_timings, timed
+
+ALIGNMENT = 64
+
+
+class SharedFrame:
+    """
+    A DataFrame laid out in a shared memory block for another process.
+
+    Numeric and datetime64 columns are copied into the block as they are.
+    Object columns are factorized, so only their integer codes go into the
+    block and just the distinct values are pickled alongside the layout.
+    Missing values in object columns come back as None. Categoricals share
+    their codes the same way with the dtype pickled alongside. Anything
+    else (other extension dtypes) is pickled as a column.
+    """
+
+    def __init__(self, data: pd.DataFrame):
+        columns = []
+        arrays = []
+        size = 0
+        for name in data.columns:
+            column = data[name]
+            if column.dtype == object:
+                codes, uniques = pd.factorize(column)
+                array = codes.astype(np.int32 if len(uniques) < 2**31 else np.int64)
+                columns.append((name, "factorized", np.asarray(uniques, dtype=object)))
+            elif isinstance(column.dtype, pd.CategoricalDtype):
+                array = column.cat.codes.to_numpy()
+                columns.append((name, "categorical", column.dtype))
+            elif isinstance(column.dtype, np.dtype) and column.dtype.kind in "biufmM":
+                array = column.to_numpy()
+                columns.append((name, "array", None))
+            else:
+                columns.append((name, "pickled", column.array))
+                continue
+            arrays.append((array, size))
+            size += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+        self.shared_memory = SharedMemory(create=True, size=max(size, 1))
+        self.name = self.shared_memory.name
+        self.length = len(data)
+        self.index = None if isinstance(data.index, pd.RangeIndex) else data.index
+        self.layout = []
+        arrays = iter(arrays)
+        for name, kind, values in columns:
+            if kind == "pickled":
+                self.layout.append((name, kind, None, 0, values))
+                continue
+            array, offset = next(arrays)
+            np.ndarray(
+                array.shape, array.dtype, self.shared_memory.buf, offset
+            )[:] = array
+            self.layout.append((name, kind, array.dtype.str, offset, values))
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state["shared_memory"]
+        return state
+
+    def load(self) -> pd.DataFrame:
+        shared_memory = SharedMemory(name=self.name)
+        try:
+            columns = {}
+            for name, kind, dtype, offset, values in self.layout:
+                if kind == "pickled":
+                    columns[name] = values
+                    continue
+                array = np.ndarray(
+                    (self.length,), np.dtype(dtype), shared_memory.buf, offset
+                ).copy()
+                if kind == "factorized":
+                    columns[name] = np.append(values, None)[array]
+                elif kind == "categorical":
+                    columns[name] = pd.Categorical.from_codes(array, dtype=values)
+                else:
+                    columns[name] = array
+            return pd.DataFrame(columns, index=self.index)
+        finally:
+            shared_memory.close()
+
+    def release(self) -> None:
+        self.shared_memory.close()
+        self.shared_memory.unlink()
+
+
+def _run_with_frame(func: Callable, frame: SharedFrame, args: tuple) -> tuple:
+    timings = []
+    token = stage_timings.set(timings)
+    try:
+        with timed("worker_load"):
+            data = frame.load()
+        return func(data, *args), timings
+    finally:
+        stage_timings.reset(token)
+
+
+def _ready() -> None:
+    pass
+
+
+class WorkerPool:
+    """
+    Runs CPU bound DataFrame work in separate processes.
+
+    With no workers configured the function is called inline instead.
+    """
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.executor: Optional[ProcessPoolExecutor] = None
+
+    def get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self.executor is None and self.workers > 0:
+            self.executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self.executor
+
+    async def run(self, func: Callable, data: pd.DataFrame, *args) -> Any:
+        executor = self.get_executor()
+        if executor is None:
+            return func(data, *args)
+
+        with timed("worker_share"):
+            frame = SharedFrame(data)
+        try:
+            result, timings = await asyncio.get_running_loop().run_in_executor(
+                executor, _run_with_frame, func, frame, args
+            )
+        finally:
+            frame.release()
+
+        request_timings = stage_timings.get()
+        if request_timings is not None:
+            request_timings.extend(timings)
+        return result
+
+    async def warm_up(self) -> None:
+        executor = self.get_executor()
+        if executor is None:
+            return
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(
+            *[loop.run_in_executor(executor, _ready) for _ in range(self.workers)]
+        )
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+
+worker_pool = WorkerPool(config.transformation_workers)
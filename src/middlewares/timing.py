@@ -0,0 +1,42 @@
+import time
+from typing import Callable
+
+from fastapi import Request
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from ..helpers.timing import (
+    request_timings,
+    server_timing_header,
+    stage_timings,
+    summarise_stages,
+)
+
+
+class TimingMiddleware(BaseHTTPMiddleware):
+    def __init__(
+        self,
+        app,
+    ):
+        super().__init__(app)
+
+    async def dispatch(self, request: Request, call_next: Callable):
+        timings = []
+        token = stage_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await call_next(request)
+        finally:
+            stage_timings.reset(token)
+
+        stages = summarise_stages(timings)
+        stages["total"] = (time.perf_counter() - started) * 1000
+        response.headers["Server-Timing"] = server_timing_header(stages)
+
+        route = request.scope.get("route")
+        request_timings.record(
+            getattr(route, "path", request.url.path),
+            str(request.url.path)
+            + (f"?{request.url.query}" if request.url.query else ""),
+            stages,
+        )
+        return response
@@ -1,5 +1,5 @@
 from datetime import date, datetime
-from typing import List, Optional
+from typing import List, Optional, Tuple
 
 from .base_entity import BaseEntity
 
@@ -74,9 +74,19 @@ class BettingSelectionsAnalysis(BaseEntity):
     bet_number: Optional[int]
 
 
+class BettingSelectionsFilter(BaseEntity):
+    betting_types: List[str] = []
+    session_id: Optional[int] = None
+    date_from: Optional[date] = None
+    date_to: Optional[date] = None
+    cursor: Optional[Tuple[str, datetime, int]] = None
+    limit: Optional[int] = None
+
+
 class BettingSelectionsAnalysisResponse(BaseEntity):
     number_of_bets: int
     overall_total: float
     session_number_of_bets: int
     session_overall_total: float
+    next_cursor: Optional[str] = None
     result_dict: List[BettingSelectionsAnalysis]
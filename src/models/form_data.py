@@ -97,6 +97,13 @@ class TodaysPerformanceDataResponse(BaseEntity):
     todays_official_rating: Optional[int]
     todays_days_since_last_ran: Optional[int]
     performance_data: List[TodaysHorseFormData]
+    next_cursor: Optional[str] = None
+
+
+class TodaysHorseFormPage(BaseEntity):
+    horse_id: int
+    performance_data: List[TodaysHorseFormData]
+    next_cursor: Optional[str] = None
 
 
 class TodaysRaceFormData(BaseEntity):
@@ -0,0 +1,328 @@
+import csv
+import io
+import re
+import weakref
+from collections import OrderedDict
+from typing import Optional
+
+import asyncpg
+import pandas as pd
+import pyarrow as pa
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from ..config import config
+from ..helpers.timing import timed
+from .frame_schema import FrameSchema
+
+NAMED_PARAMETER = re.compile(r"(?<!:):(\w+)")
+
+INTEGER_TYPES = {"int2", "int4", "int8", "oid"}
+FLOAT_TYPES = {"float4", "float8", "numeric", "money"}
+DATE_TYPES = {"date"}
+TIMESTAMP_TYPES = {"timestamp"}
+TIMESTAMPTZ_TYPES = {"timestamptz"}
+BOOLEAN_TYPES = {"bool"}
+COPY_NULL = "\\N"
+TEXT_TYPES = {"text", "varchar", "bpchar", "name"}
+RECORD_TYPES = (
+    INTEGER_TYPES
+    | FLOAT_TYPES
+    | DATE_TYPES
+    | TIMESTAMP_TYPES
+    | TIMESTAMPTZ_TYPES
+    | BOOLEAN_TYPES
+    | TEXT_TYPES
+)
+
+
+class StatementCache:
+    """
+    Server-side prepared statements kept per pooled connection, keyed by
+    query text, so each repository query is parsed and described once per
+    connection rather than on every call.
+
+    Reads made with ``prepared=True`` execute the cached statement, so the
+    server can also reuse its plan. Other reads only take their column
+    types from it: they run as COPY, which cannot execute a prepared
+    statement and so is planned on every call.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.statements = weakref.WeakKeyDictionary()
+        self.hits = 0
+        self.misses = 0
+
+    async def prepare(self, connection, query: str):
+        statements = self.statements.setdefault(connection, OrderedDict())
+        statement = statements.get(query)
+        if statement is not None:
+            self.hits += 1
+            statements.move_to_end(query)
+            return statement
+        self.misses += 1
+        statement = await connection.prepare(query)
+        if self.size > 0:
+            statements[query] = statement
+            if len(statements) > self.size:
+                statements.popitem(last=False)
+        return statement
+
+    def discard(self, connection, query: str) -> None:
+        self.statements.get(connection, {}).pop(query, None)
+
+    def to_dict(self) -> dict:
+        return {
+            "connections": len(self.statements),
+            "statements": sum(len(s) for s in self.statements.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+statement_cache = StatementCache(config.db_statement_cache_size)
+
+
+class BaseRepository:
+    def __init__(self, session: AsyncSession):
+        self.session = session
+
+    async def fetch_frame(
+        self,
+        query: str,
+        params: Optional[dict] = None,
+        schema: Optional[FrameSchema] = None,
+        prepared: bool = False,
+    ) -> pd.DataFrame:
+        """
+        Run a read query and load the result column by column.
+
+        The rows are streamed with COPY ... TO STDOUT as CSV and parsed by
+        pandas' C reader, so no Row or Record object is built per row. The
+        column types of the prepared statement decide each column's dtype,
+        narrowed further by ``schema`` when one is given.
+
+        Lookups of a handful of rows pass ``prepared=True`` to execute the
+        cached prepared statement instead, skipping the planning COPY pays
+        for on every call. That path builds a Record per row, so reads of
+        whole horse histories stay on COPY. The dtypes match either way.
+        """
+        if prepared:
+            data = await self._fetch_prepared(query, params)
+        else:
+            buffer, columns = await self._copy_query(query, params)
+            with timed("db_parse"):
+                data = self._read_columns(buffer, columns)
+        return data if schema is None else schema.apply(data)
+
+    async def fetch_table(self, query: str, params: Optional[dict] = None) -> pa.Table:
+        """
+        Run a read query into an Arrow table typed from the result columns.
+
+        Integer columns stay int64 with nulls, so slices of the table convert
+        back to the same dtypes fetch_frame would have returned for them.
+        """
+        buffer, columns = await self._copy_query(query, params)
+        data = self._read_columns(buffer, columns)
+        schema = pa.schema(
+            [(name, self._arrow_type(pg_type)) for name, pg_type in columns]
+        )
+        return pa.Table.from_pandas(
+            data, schema=schema, preserve_index=False
+        ).replace_schema_metadata(None)
+
+    async def _fetch_prepared(self, query: str, params: Optional[dict]) -> pd.DataFrame:
+        """
+        Execute the query's cached prepared statement and load its records,
+        falling back to COPY for results with columns of other types.
+        """
+        positional_query, args = self._to_positional(query, params or {})
+        with timed("db"):
+            connection = await self._driver_connection()
+            statement = await statement_cache.prepare(connection, positional_query)
+            columns = self._columns(statement)
+            if any(pg_type not in RECORD_TYPES for _, pg_type in columns):
+                statement = None
+            else:
+                try:
+                    records = await statement.fetch(*args)
+                except asyncpg.exceptions.InvalidCachedStatementError:
+                    statement_cache.discard(connection, positional_query)
+                    statement = await statement_cache.prepare(
+                        connection, positional_query
+                    )
+                    columns = self._columns(statement)
+                    records = await statement.fetch(*args)
+        if statement is None:
+            buffer, columns = await self._copy_query(query, params)
+            with timed("db_parse"):
+                return self._read_columns(buffer, columns)
+        with timed("db_parse"):
+            return self._read_records(records, columns)
+
+    async def _copy_query(
+        self, query: str, params: Optional[dict]
+    ) -> tuple[io.BytesIO, list[tuple[str, str]]]:
+        """
+        COPY the query out as CSV, positioned after the header row.
+
+        The column types come from the query's cached prepared statement,
+        which is prepared again if the header shows the columns changed.
+        COPY takes no bind parameters, so asyncpg inlines the arguments as
+        literals quoted by the server. NULL is written as \\N, keeping empty
+        strings apart from it; only a text value of exactly \\N reads back
+        as a null.
+        """
+        query, args = self._to_positional(query, params or {})
+        with timed("db"):
+            connection = await self._driver_connection()
+            statement = await statement_cache.prepare(connection, query)
+            buffer = io.BytesIO()
+            await connection.copy_from_query(
+                query,
+                *args,
+                output=buffer,
+                format="csv",
+                header=True,
+                null=COPY_NULL,
+            )
+            buffer.seek(0)
+            names = next(csv.reader([buffer.readline().decode()]), [])
+            columns = self._columns(statement)
+            if names != [name for name, _ in columns]:
+                statement_cache.discard(connection, query)
+                statement = await statement_cache.prepare(connection, query)
+                columns = self._columns(statement)
+        return buffer, columns
+
+    @staticmethod
+    def _columns(statement) -> list[tuple[str, str]]:
+        return [
+            (attribute.name, attribute.type.name)
+            for attribute in statement.get_attributes()
+        ]
+
+    async def get_view_version(self, view: str) -> str:
+        """
+        A version string for a materialized view that changes whenever the
+        view is refreshed or rows are written to it.
+        """
+        result = await self.session.execute(
+            text(
+                """
+                SELECT c.relfilenode::text
+                    || ':' || COALESCE(s.n_tup_ins, 0)
+                    || ':' || COALESCE(s.n_tup_del, 0) AS version
+                    FROM pg_class c
+                    LEFT JOIN pg_stat_user_tables s
+                    on s.relid = c.oid
+                    WHERE c.oid = CAST(:view AS regclass)
+                 """
+            ),
+            {"view": view},
+        )
+        return result.scalar_one()
+
+    async def copy_records(
+        self, table: str, columns: list[str], records: list[tuple]
+    ) -> None:
+        schema_name, table_name = table.split(".")
+        connection = await self._driver_connection()
+        await connection.copy_records_to_table(
+            table_name, schema_name=schema_name, columns=columns, records=records
+        )
+
+    async def _driver_connection(self):
+        connection = await self.session.connection()
+        raw_connection = await connection.get_raw_connection()
+        return raw_connection.driver_connection
+
+    @staticmethod
+    def _to_positional(query: str, params: dict) -> tuple[str, list]:
+        names = []
+
+        def placeholder(match: re.Match) -> str:
+            name = match.group(1)
+            if name not in names:
+                names.append(name)
+            return f"${names.index(name) + 1}"
+
+        return NAMED_PARAMETER.sub(placeholder, query), [params[n] for n in names]
+
+    @staticmethod
+    def _arrow_type(pg_type: str) -> pa.DataType:
+        if pg_type in INTEGER_TYPES:
+            return pa.int64()
+        if pg_type in FLOAT_TYPES:
+            return pa.float64()
+        if pg_type in DATE_TYPES:
+            return pa.date32()
+        if pg_type in TIMESTAMP_TYPES:
+            return pa.timestamp("ns")
+        if pg_type in TIMESTAMPTZ_TYPES:
+            return pa.timestamp("ns", tz="UTC")
+        if pg_type in BOOLEAN_TYPES:
+            return pa.bool_()
+        return pa.string()
+
+    @staticmethod
+    def _read_columns(
+        buffer: io.BytesIO, columns: list[tuple[str, str]]
+    ) -> pd.DataFrame:
+        names = [name for name, _ in columns]
+        if buffer.tell() >= buffer.getbuffer().nbytes:
+            return pd.DataFrame(columns=names)
+
+        dtypes = {}
+        for name, pg_type in columns:
+            if pg_type in FLOAT_TYPES:
+                dtypes[name] = "float64"
+            elif pg_type not in INTEGER_TYPES:
+                dtypes[name] = object
+        data = pd.read_csv(
+            buffer,
+            header=None,
+            names=names,
+            dtype=dtypes,
+            keep_default_na=False,
+            na_values=[COPY_NULL],
+            float_precision="round_trip",
+        )
+
+        for name, pg_type in columns:
+            if pg_type in DATE_TYPES:
+                column = pd.to_datetime(data[name], format="%Y-%m-%d", errors="coerce")
+                data[name] = column.dt.date.astype(object).where(column.notna(), None)
+            elif pg_type in TIMESTAMP_TYPES:
+                data[name] = pd.to_datetime(data[name], format="ISO8601")
+            elif pg_type in TIMESTAMPTZ_TYPES:
+                data[name] = pd.to_datetime(data[name], format="ISO8601", utc=True)
+            elif pg_type in BOOLEAN_TYPES:
+                data[name] = data[name].map({"t": True, "f": False})
+            elif pg_type not in INTEGER_TYPES | FLOAT_TYPES:
+                data[name] = data[name].where(data[name].notna(), None)
+        return data
+
+    @staticmethod
+    def _read_records(records: list, columns: list[tuple[str, str]]) -> pd.DataFrame:
+        """Build the frame _read_columns would have parsed from the same rows."""
+        names = [name for name, _ in columns]
+        if not records:
+            return pd.DataFrame(columns=names)
+
+        data = {}
+        for i, (name, pg_type) in enumerate(columns):
+            values = pd.Series([record[i] for record in records], dtype=object)
+            if pg_type in INTEGER_TYPES:
+                values = pd.to_numeric(values)
+            elif pg_type in FLOAT_TYPES:
+                values = values.astype("float64")
+            elif pg_type in TIMESTAMP_TYPES:
+                values = pd.to_datetime(values)
+            elif pg_type in TIMESTAMPTZ_TYPES:
+                values = pd.to_datetime(values, utc=True)
+            elif pg_type in BOOLEAN_TYPES:
+                values = values.map({True: True, False: False})
+            data[name] = values
+        return pd.DataFrame(data)
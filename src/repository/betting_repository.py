@@ -1,55 +1,82 @@
 from datetime import datetime
+from typing import Optional
 
-import pandas as pd
 from fastapi import Depends
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..helpers.session_manager import get_current_session
 from ..models.betting_selections import BettingSelections
+from .base_repository import BaseRepository
 
 
-class BettingRepository:
-    def __init__(self, session: AsyncSession):
-        self.session = session
-
+class BettingRepository(BaseRepository):
     async def store_betting_selections(
         self, selections: BettingSelections, session_id: int
     ) -> dict:
         race_date = datetime.strptime(selections.race_date, "%Y-%m-%d").date()
         await self.session.execute(text("TRUNCATE TABLE betting.selections"))
-        race_id = selections.race_id
-        for selection in selections.selections:
-            horse_id = selection.horse_id
-            betting_type = selection.bet_type
-            await self.session.execute(
-                text(
-                    """
-                    INSERT INTO betting.selections (race_date, race_id, horse_id, betting_type, session_id, created_at) 
-                    VALUES (:race_date, :race_id, :horse_id, :betting_type, :session_id, :created_at)
-                    """
-                ),
-                {
-                    "race_date": race_date,
-                    "race_id": race_id,
-                    "horse_id": horse_id,
-                    "betting_type": betting_type,
-                    "session_id": session_id,
-                    "created_at": datetime.now(),
-                },
-            )
-        await self.session.commit()
-        await self.session.execute(text("CALL betting.update_selections_info()"))
+        await self.copy_records(
+            "betting.selections",
+            [
+                "race_date",
+                "race_id",
+                "horse_id",
+                "betting_type",
+                "session_id",
+                "created_at",
+            ],
+            [
+                (
+                    race_date,
+                    selections.race_id,
+                    selection.horse_id,
+                    selection.bet_type,
+                    session_id,
+                    datetime.now(),
+                )
+                for selection in selections.selections
+            ],
+        )
         await self.session.commit()
         return {
             "message": f"Stored {len(selections.selections)} selections for race {selections.race_id}"
         }
 
-    async def get_betting_selections_analysis(self):
+    async def update_selections_info(self) -> None:
+        await self.session.execute(text("CALL betting.update_selections_info()"))
+        await self.session.commit()
+
+    async def get_betting_selections_analysis(
+        self, created_after: Optional[datetime] = None
+    ):
+        if created_after is None:
+            return await self.fetch_frame(
+                """
+                SELECT * FROM betting.selections_info
+                ORDER BY created_at, race_id, horse_id
+                """
+            )
+        return await self.fetch_frame(
+            """
+            SELECT * FROM betting.selections_info
+            WHERE created_at > :created_after
+            ORDER BY created_at, race_id, horse_id
+            """,
+            {"created_after": created_after},
+        )
+
+    async def count_selections_info(self, created_through: datetime) -> int:
         result = await self.session.execute(
-            text("SELECT * FROM betting.selections_info")
+            text(
+                """
+                SELECT COUNT(*) FROM betting.selections_info
+                WHERE created_at <= :created_through
+                """
+            ),
+            {"created_through": created_through},
         )
-        return pd.DataFrame(result.fetchall())
+        return result.scalar_one()
 
 
 def get_betting_repository(session: AsyncSession = Depends(get_current_session)):
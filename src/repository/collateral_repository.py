@@ -1,34 +1,31 @@
 from datetime import datetime
 
-import pandas as pd
 from fastapi import Depends
-from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..helpers.session_manager import get_current_session
+from .base_repository import BaseRepository
 
+# select_collateral_form_data_by_race_id leaves out the runner it is given.
+# No horse has id 0, so passing it returns every runner of the race.
+ALL_RUNNERS = 0
 
-class CollateralRepository:
-    def __init__(self, session: AsyncSession):
-        self.session = session
 
-    async def get_collateral_form_by_id(
-        self, race_date: str, race_id: int, todays_race_date: str, horse_id: int
+class CollateralRepository(BaseRepository):
+    async def get_collateral_form_by_race_id(
+        self, race_date: str, race_id: int, todays_race_date: str
     ):
-        result = await self.session.execute(
-            text(
-                "SELECT * from public.select_collateral_form_data_by_race_id(:race_date, :race_id, :todays_race_date, :horse_id)"
-            ),
+        return await self.fetch_frame(
+            "SELECT * from public.select_collateral_form_data_by_race_id(:race_date, :race_id, :todays_race_date, :horse_id)",
             {
                 "race_date": datetime.strptime(race_date, "%Y-%m-%d").date(),
                 "race_id": race_id,
                 "todays_race_date": datetime.strptime(
                     todays_race_date, "%Y-%m-%d"
                 ).date(),
-                "horse_id": horse_id,
+                "horse_id": ALL_RUNNERS,
             },
         )
-        return pd.DataFrame(result.fetchall())
 
 
 def get_collateral_repository(session: AsyncSession = Depends(get_current_session)):
@@ -1,85 +1,156 @@
 import asyncio
-from datetime import datetime
+from datetime import date, datetime
+from typing import Optional
 
-import pandas as pd
 from fastapi import Depends
 from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..helpers.session_manager import get_current_session
+from .base_repository import BaseRepository
+from .feedback_snapshots import FeedbackSnapshot, feedback_snapshots
+from .frame_schema import PERFORMANCE_SCHEMA
+from .history_store import FEEDBACK_VIEW, feedback_history_store
+from .view_versions import ViewVersionRepository, view_versions
 
+SNAPSHOT_QUERY = f"""
+    SELECT *
+        FROM {FEEDBACK_VIEW}
+        WHERE horse_id IN (
+            SELECT horse_id
+            FROM {FEEDBACK_VIEW}
+            WHERE data_type = 'today'
+        )
+"""
 
-class FeedbackRepository:
-    def __init__(self, session: AsyncSession):
-        self.session = session
 
+class FeedbackRepository(BaseRepository):
     async def get_todays_races(self):
-        result = await self.session.execute(
-            text(
-                """
-                SELECT DISTINCT ON (course, race_time) *
-                FROM  public.feedback_performance_data_mat_vw
-                WHERE data_type = 'today'
-                ORDER BY course, race_time
-                """
-            ),
+        snapshot = await self.get_snapshot()
+        if snapshot is not None:
+            return snapshot.get_todays_races()
+        data = await self.fetch_frame(
+            """
+            SELECT DISTINCT ON (course, race_time) *
+            FROM  public.feedback_performance_data_mat_vw
+            WHERE data_type = 'today'
+            ORDER BY course, race_time
+            """
         )
-        data = pd.DataFrame(result.fetchall())
         return data
 
     async def get_race_by_id(self, race_id: int):
-        result = await self.session.execute(
-            text(
-                """
-                SELECT * 
+        snapshot = await self.get_snapshot()
+        if snapshot is not None:
+            data = snapshot.get_race_by_id(race_id)
+            if data is not None:
+                return PERFORMANCE_SCHEMA.apply(data)
+        if feedback_history_store.enabled:
+            data = feedback_history_store.get_race(
+                race_id, await self.get_view_version(FEEDBACK_VIEW)
+            )
+            if data is not None:
+                return PERFORMANCE_SCHEMA.apply(data)
+        return await self.fetch_frame(
+            """
+            SELECT * 
+                FROM public.feedback_performance_data_mat_vw 
+                WHERE horse_id IN (
+                    SELECT horse_id 
                     FROM public.feedback_performance_data_mat_vw 
-                    WHERE horse_id IN (
-                        SELECT horse_id 
-                        FROM public.feedback_performance_data_mat_vw 
-                        WHERE race_id = :race_id
-                    )
-                 """
-            ),
+                    WHERE race_id = :race_id
+                )
+             """,
             {"race_id": race_id},
+            PERFORMANCE_SCHEMA,
         )
-        return pd.DataFrame(result.fetchall())
 
     async def get_race_result_by_id(self, race_id: int):
-        result = await self.session.execute(
-            text(
-                """
-                    SELECT * 
-                        FROM public.feedback_performance_data_mat_vw 
-                        WHERE race_id = :race_id
-                 """
-            ),
+        snapshot = await self.get_snapshot()
+        if snapshot is not None:
+            data = snapshot.get_race_result_by_id(race_id)
+            if data is not None:
+                return data
+        return await self.fetch_frame(
+            """
+                SELECT * 
+                    FROM public.feedback_performance_data_mat_vw 
+                    WHERE race_id = :race_id
+             """,
             {"race_id": race_id},
         )
-        return pd.DataFrame(result.fetchall())
 
     async def store_current_date_today(self, date: str):
+        view_versions.feedback = None
+        await self._store_current_date_today(date)
+        await view_versions.refresh(ViewVersionRepository(self.session))
+
+    async def _store_current_date_today(self, date: str):
         date_obj = datetime.strptime(date, "%Y-%m-%d").date()
-        try:
-            await asyncio.gather(
-                self.session.execute(
-                    text("UPDATE public.feedback_date SET today_date = :date"),
-                    {"date": date_obj},
-                ),
-                self.session.execute(
-                    text("SELECT public.insert_feedback_data_by_date(:date)"),
+        if not feedback_snapshots.enabled:
+            await self._insert_feedback_data(date_obj)
+            return
+        async with feedback_snapshots.lock:
+            if date_obj in feedback_snapshots.days:
+                await self._execute_and_commit(
+                    "UPDATE public.feedback_date SET today_date = :date",
                     {"date": date_obj},
-                ),
+                )
+                if feedback_snapshots.activate(date_obj):
+                    return
+            await self._materialize_snapshot(date_obj)
+
+    async def get_snapshot(self) -> Optional[FeedbackSnapshot]:
+        """
+        The snapshot for the current feedback date, taken from the feedback
+        tables the first time the date is seen without one on disk.
+        """
+        if not feedback_snapshots.enabled:
+            return None
+        if feedback_snapshots.current is not None:
+            return feedback_snapshots.current
+        async with feedback_snapshots.lock:
+            if feedback_snapshots.current is None:
+                data = await self.get_current_date_today()
+                today_date = data["today_date"].iloc[0]
+                if isinstance(today_date, datetime):
+                    today_date = today_date.date()
+                if not feedback_snapshots.activate(today_date):
+                    await self._materialize_snapshot(today_date)
+        return feedback_snapshots.current
+
+    async def _materialize_snapshot(self, date_obj: date):
+        await self._insert_feedback_data(date_obj)
+        table = await self.fetch_table(SNAPSHOT_QUERY)
+        await asyncio.to_thread(feedback_snapshots.put, date_obj, table)
+
+    async def _insert_feedback_data(self, date_obj: date):
+        try:
+            await self.session.execute(
+                text("UPDATE public.feedback_date SET today_date = :date"),
+                {"date": date_obj},
+            )
+            await self.session.execute(
+                text("SELECT public.insert_feedback_data_by_date(:date)"),
+                {"date": date_obj},
             )
             await self.session.commit()
         except Exception as e:
             await self.session.rollback()
             raise e from e
 
+    async def _execute_and_commit(self, query: str, params: dict):
+        try:
+            await self.session.execute(text(query), params)
+            await self.session.commit()
+        except Exception as e:
+            await self.session.rollback()
+            raise e from e
+
     async def get_current_date_today(self):
-        result = await self.session.execute(
-            text("SELECT * from public.feedback_date"),
+        return await self.fetch_frame(
+            "SELECT * from public.feedback_date", prepared=True
         )
-        return pd.DataFrame(result.fetchall())
 
 
 def get_feedback_repository(session: AsyncSession = Depends(get_current_session)):
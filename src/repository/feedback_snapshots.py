@@ -0,0 +1,121 @@
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from datetime import date
+from typing import Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from ..config import config
+from ..helpers.timing import timed
+from .history_store import read_table, write_table
+
+
+class FeedbackSnapshot:
+    """
+    The feedback view as materialized for one date, restricted to the rows
+    the feedback endpoints read: that day's races and the histories of the
+    horses running in them.
+    """
+
+    def __init__(self, day: date, table: pa.Table):
+        self.day = day
+        self.table = table
+        self.today = table.filter(pc.equal(table["data_type"], "today"))
+
+    @timed("snapshot")
+    def get_todays_races(self) -> pd.DataFrame:
+        return (
+            self.today.to_pandas()
+            .sort_values(["course", "race_time"], kind="stable")
+            .drop_duplicates(subset=["course", "race_time"])
+            .reset_index(drop=True)
+        )
+
+    @timed("snapshot")
+    def get_race_by_id(self, race_id: int) -> Optional[pd.DataFrame]:
+        horse_ids = pc.unique(
+            self.today.filter(pc.equal(self.today["race_id"], race_id))["horse_id"]
+        )
+        if not len(horse_ids):
+            return None
+        return self.table.filter(pc.is_in(self.table["horse_id"], horse_ids)).to_pandas()
+
+    @timed("snapshot")
+    def get_race_result_by_id(self, race_id: int) -> Optional[pd.DataFrame]:
+        race = self.today.filter(pc.equal(self.today["race_id"], race_id))
+        return race.to_pandas() if race.num_rows else None
+
+
+class FeedbackSnapshots:
+    """
+    Feedback days kept on disk as Arrow IPC files keyed by date.
+
+    Switching to a date that has a snapshot only swaps the current snapshot,
+    without rebuilding the feedback tables. The least recently used days are
+    evicted once more than max_days are stored.
+    """
+
+    def __init__(self, path: Optional[str], max_days: int):
+        self.directory = path
+        self.max_days = max_days
+        self.days: OrderedDict[date, None] = OrderedDict()
+        self.current: Optional[FeedbackSnapshot] = None
+        self.lock = asyncio.Lock()
+        self.loaded = False
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def load(self) -> None:
+        if self.loaded:
+            return
+        self.loaded = True
+        manifest_path = os.path.join(self.directory, "manifest.json")
+        if os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                days = [date.fromisoformat(day) for day in json.load(f)["days"]]
+            self.days = OrderedDict(
+                (day, None) for day in days if os.path.exists(self._path(day))
+            )
+
+    def activate(self, day: date) -> bool:
+        self.load()
+        if self.current is not None and self.current.day == day:
+            return True
+        if day not in self.days:
+            return False
+        self.current = FeedbackSnapshot(day, read_table(self._path(day)))
+        self.days.move_to_end(day)
+        self._save_manifest()
+        return True
+
+    def put(self, day: date, table: pa.Table) -> None:
+        self.load()
+        os.makedirs(self.directory, exist_ok=True)
+        write_table(self._path(day), table)
+        self.days[day] = None
+        self.days.move_to_end(day)
+        self.current = FeedbackSnapshot(day, read_table(self._path(day)))
+        while len(self.days) > self.max_days:
+            evicted, _ = self.days.popitem(last=False)
+            os.remove(self._path(evicted))
+        self._save_manifest()
+
+    def _save_manifest(self) -> None:
+        path = os.path.join(self.directory, "manifest.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"days": [str(day) for day in self.days]}, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _path(self, day: date) -> str:
+        return os.path.join(self.directory, f"feedback-{day}.arrow")
+
+
+feedback_snapshots = FeedbackSnapshots(
+    config.feedback_snapshot_path, config.feedback_snapshot_days
+)
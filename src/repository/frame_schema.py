@@ -0,0 +1,76 @@
+import numpy as np
+import pandas as pd
+
+INT32 = np.iinfo(np.int32)
+
+
+class FrameSchema:
+    """
+    Compact dtypes for the columns of a query result.
+
+    Repeated strings become categoricals, mostly distinct text becomes Arrow
+    backed strings and int64 columns whose values fit are narrowed to int32.
+    Missing values in either string form read back as None through
+    frame_records, the same as the object columns they replace.
+    """
+
+    def __init__(self, categories: list[str], strings: list[str]):
+        self.categories = categories
+        self.strings = strings
+
+    def apply(self, data: pd.DataFrame) -> pd.DataFrame:
+        columns = {}
+        for name in self.categories:
+            if name in data and data[name].dtype == object:
+                columns[name] = data[name].astype("category")
+        for name in self.strings:
+            if name in data and data[name].dtype == object:
+                columns[name] = data[name].astype("string[pyarrow]")
+        for name in data.columns:
+            column = data[name]
+            if column.dtype == np.int64 and self._fits_int32(column):
+                columns[name] = column.astype(np.int32)
+        return data.assign(**columns) if columns else data
+
+    @staticmethod
+    def _fits_int32(column: pd.Series) -> bool:
+        return column.empty or (
+            column.min() >= INT32.min and column.max() <= INT32.max
+        )
+
+
+PERFORMANCE_SCHEMA = FrameSchema(
+    categories=[
+        "horse_name",
+        "horse_sex",
+        "headgear",
+        "weight_carried",
+        "industry_sp",
+        "race_title",
+        "race_type",
+        "distance",
+        "conditions",
+        "going",
+        "hcap_range",
+        "age_range",
+        "surface",
+        "winning_time",
+        "relative_to_standard",
+        "country",
+        "meeting_id",
+        "course",
+        "dam",
+        "sire",
+        "trainer",
+        "jockey",
+        "data_type",
+    ],
+    strings=[
+        "unique_id",
+        "in_race_comment",
+        "tf_comment",
+        "tfr_view",
+        "main_race_comment",
+    ],
+)
+
@@ -0,0 +1,280 @@
+import asyncio
+import json
+import os
+from datetime import date
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from ..config import config
+from ..helpers.logging_config import logger
+from ..helpers.session_manager import background_session
+from ..helpers.timing import timed
+from .base_repository import BaseRepository
+
+TODAYS_VIEW = "public.todays_performance_data_mat_vw"
+FEEDBACK_VIEW = "public.feedback_performance_data_mat_vw"
+
+TODAYS_SOURCE = f"""
+    SELECT pd.*, h.bf_id::integer as betfair_id
+        FROM {TODAYS_VIEW} pd
+        LEFT JOIN public.horse h
+        on h.id = pd.horse_id
+"""
+FEEDBACK_SOURCE = f"SELECT * FROM {FEEDBACK_VIEW}"
+
+
+class HistoryRepository(BaseRepository):
+    async def count_history_through(self, view: str, race_date: date) -> int:
+        data = await self.fetch_frame(
+            f"""
+            SELECT COUNT(*) AS rows
+                FROM {view}
+                WHERE data_type = 'historical'
+                AND race_date <= :race_date
+            """,
+            {"race_date": race_date},
+            prepared=True,
+        )
+        return int(data["rows"].iloc[0])
+
+    async def get_history_since(
+        self, source: str, race_date: Optional[date]
+    ) -> pa.Table:
+        if race_date is None:
+            return await self.fetch_table(
+                f"SELECT * FROM ({source}) source WHERE data_type = 'historical'"
+            )
+        return await self.fetch_table(
+            f"""
+            SELECT * FROM ({source}) source
+                WHERE data_type = 'historical'
+                AND race_date > :race_date
+            """,
+            {"race_date": race_date},
+        )
+
+    async def get_today(self, source: str) -> pa.Table:
+        return await self.fetch_table(
+            f"SELECT * FROM ({source}) source WHERE data_type = 'today'"
+        )
+
+
+class HistoryBucket:
+    """
+    One partition of the store: the historical rows of every horse whose
+    horse_id falls in it, sorted by horse and race time in a memory-mapped
+    Arrow IPC file, with the row range of each horse kept alongside.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.table = read_table(path)
+        horse_ids = self.table.column("horse_id").to_numpy()
+        self.horse_ids, self.starts = np.unique(horse_ids, return_index=True)
+        self.ends = np.append(self.starts[1:], len(horse_ids))
+
+    def get(self, horse_id: int) -> Optional[pa.Table]:
+        i = np.searchsorted(self.horse_ids, horse_id)
+        if i == len(self.horse_ids) or self.horse_ids[i] != horse_id:
+            return None
+        return self.table.slice(self.starts[i], self.ends[i] - self.starts[i])
+
+    @staticmethod
+    def write(path: str, table: pa.Table) -> "HistoryBucket":
+        write_table(
+            path,
+            table.sort_by([("horse_id", "ascending"), ("race_time", "ascending")]),
+        )
+        return HistoryBucket(path)
+
+
+def read_table(path: str) -> pa.Table:
+    return pa.ipc.open_file(pa.memory_map(path)).read_all()
+
+
+def write_table(path: str, table: pa.Table) -> None:
+    with pa.OSFile(f"{path}.tmp", "wb") as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    os.replace(f"{path}.tmp", path)
+
+
+class HistoryStore:
+    """
+    Local copy of a performance view for looking up a race's horse histories.
+
+    Historical rows are partitioned on horse_id into memory-mapped Arrow
+    files and synced incrementally: only rows after the stored race_date
+    watermark are fetched, and the store is rebuilt when the view's count of
+    rows up to the watermark no longer matches. Lookups are only answered
+    while the view is still at the version the store was synced from.
+    """
+
+    def __init__(
+        self, path: Optional[str], view: str, source: str, partitions: int
+    ):
+        self.directory = (
+            None if path is None else os.path.join(path, view.split(".")[-1])
+        )
+        self.view = view
+        self.source = source
+        self.partitions = partitions
+        self.lock = asyncio.Lock()
+        self.loaded = False
+        self.clear()
+
+    @property
+    def enabled(self) -> bool:
+        return self.directory is not None
+
+    def clear(self) -> None:
+        self.version: Optional[str] = None
+        self.watermark: Optional[date] = None
+        self.rows = 0
+        self.buckets: dict[int, HistoryBucket] = {}
+        self.today: Optional[pa.Table] = None
+
+    @timed("history_store")
+    def get_race(self, race_id: int, version: str) -> Optional[pd.DataFrame]:
+        if self.version != version or self.today is None:
+            return None
+        today = self.today
+        horse_ids = pc.unique(
+            today.filter(pc.equal(today["race_id"], race_id))["horse_id"]
+        )
+        if not len(horse_ids):
+            return None
+
+        tables = []
+        for horse_id in horse_ids.to_pylist():
+            bucket = self.buckets.get(horse_id % self.partitions)
+            history = None if bucket is None else bucket.get(horse_id)
+            if history is not None:
+                tables.append(history)
+        tables.append(today.filter(pc.is_in(today["horse_id"], horse_ids)))
+        return pa.concat_tables(tables).to_pandas()
+
+    async def sync(self, repository: HistoryRepository) -> None:
+        async with self.lock:
+            self.load()
+            version = await repository.get_view_version(self.view)
+            if version == self.version:
+                return
+
+            watermark = self.watermark
+            if watermark is not None:
+                rows = await repository.count_history_through(self.view, watermark)
+                if rows != self.rows:
+                    watermark = None
+            history = await repository.get_history_since(self.source, watermark)
+            today = await repository.get_today(self.source)
+
+            rebuild = watermark is None
+            buckets, today = await asyncio.to_thread(
+                self._write, history, today, rebuild
+            )
+            self.buckets = buckets
+            self.today = today
+            self.rows = history.num_rows + (0 if rebuild else self.rows)
+            if history.num_rows:
+                self.watermark = pc.max(history["race_date"]).as_py()
+            elif rebuild:
+                self.watermark = None
+            self.version = version
+            self._save_manifest()
+            logger.info(
+                f"History store {self.view} synced {history.num_rows} rows"
+                f" ({'rebuilt' if rebuild else 'incremental'})"
+            )
+
+    def load(self) -> None:
+        if self.loaded:
+            return
+        self.loaded = True
+        manifest_path = os.path.join(self.directory, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest["partitions"] != self.partitions:
+            return
+        try:
+            self.buckets = {
+                bucket: HistoryBucket(self._bucket_path(bucket))
+                for bucket in manifest["buckets"]
+            }
+            self.today = read_table(self._today_path())
+        except (OSError, pa.ArrowException) as error:
+            logger.warning(f"Discarding history store {self.view}: {error}")
+            self.clear()
+            return
+        self.version = manifest["version"]
+        self.watermark = (
+            None
+            if manifest["watermark"] is None
+            else date.fromisoformat(manifest["watermark"])
+        )
+        self.rows = manifest["rows"]
+
+    def _write(
+        self, history: pa.Table, today: pa.Table, rebuild: bool
+    ) -> tuple[dict[int, HistoryBucket], pa.Table]:
+        os.makedirs(self.directory, exist_ok=True)
+        buckets = {} if rebuild else dict(self.buckets)
+        if history.num_rows:
+            partition = history["horse_id"].to_numpy() % self.partitions
+            for bucket in np.unique(partition).tolist():
+                rows = history.take(np.flatnonzero(partition == bucket))
+                if bucket in buckets:
+                    rows = pa.concat_tables([buckets[bucket].table, rows])
+                buckets[bucket] = HistoryBucket.write(self._bucket_path(bucket), rows)
+        if rebuild:
+            for name in os.listdir(self.directory):
+                if name.startswith("history-") and int(name[8:13]) not in buckets:
+                    os.remove(os.path.join(self.directory, name))
+
+        write_table(self._today_path(), today)
+        return buckets, read_table(self._today_path())
+
+    def _save_manifest(self) -> None:
+        manifest = {
+            "version": self.version,
+            "watermark": None if self.watermark is None else str(self.watermark),
+            "rows": self.rows,
+            "partitions": self.partitions,
+            "buckets": sorted(self.buckets),
+        }
+        path = os.path.join(self.directory, "manifest.json")
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(f"{path}.tmp", path)
+
+    def _bucket_path(self, bucket: int) -> str:
+        return os.path.join(self.directory, f"history-{bucket:05d}.arrow")
+
+    def _today_path(self) -> str:
+        return os.path.join(self.directory, "today.arrow")
+
+
+todays_history_store = HistoryStore(
+    config.history_store_path,
+    TODAYS_VIEW,
+    TODAYS_SOURCE,
+    config.history_store_partitions,
+)
+feedback_history_store = HistoryStore(
+    config.history_store_path,
+    FEEDBACK_VIEW,
+    FEEDBACK_SOURCE,
+    config.history_store_partitions,
+)
+
+
+async def sync_history_stores():
+    for store in [todays_history_store, feedback_history_store]:
+        async with background_session() as session:
+            await store.sync(HistoryRepository(session))
@@ -1,17 +1,138 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Optional
+
 import pandas as pd
 from fastapi import Depends
 
 from api_helpers.s3_client import S3Client
-from src.helpers.s3_client import get_s3_client
+from src.config import config
+from src.helpers.s3_client import get_s3_client, get_s3_object_client
+from src.helpers.timing import timed
+
+PRICES_PREFIX = "price_changes/"
+PRICE_COLUMNS = [
+    "betfair_win_sp",
+    "betfair_place_sp",
+    "price_change",
+    "market_id_win",
+    "market_id_place",
+]
+
+PriceObject = tuple[str, str, datetime]
+
+
+class PricesCache:
+    def __init__(self):
+        self.prices = pd.DataFrame(
+            {column: pd.Series(dtype="float64") for column in PRICE_COLUMNS},
+            index=pd.Index([], name="betfair_id"),
+        )
+        self.source: Optional[PriceObject] = None
+        self.checked_at = 0.0
+        self.listed_at = 0.0
+        self.lock = asyncio.Lock()
+
+    def is_stale(self, ttl: float) -> bool:
+        return time.monotonic() - self.checked_at > ttl
+
+    def is_listing_stale(self, interval: float) -> bool:
+        return time.monotonic() - self.listed_at > interval
+
+
+prices_cache = PricesCache()
 
 
 class PricesRepository:
-    def __init__(self, s3_client: S3Client):
+    def __init__(self, s3_client: S3Client, s3_object_client=None):
         self.s3_client = s3_client
+        self.s3_object_client = s3_object_client
 
     async def get_current_prices(self) -> pd.DataFrame:
-        return self.s3_client.fetch_latest_price_changes("price_changes/")
+        with timed("prices"):
+            if prices_cache.is_stale(config.prices_ttl):
+                await self.refresh_prices()
+            return prices_cache.prices
+
+    async def refresh_prices(self) -> None:
+        requested_at = time.monotonic()
+        async with prices_cache.lock:
+            if prices_cache.checked_at >= requested_at:
+                return
+            full_listing = prices_cache.is_listing_stale(
+                config.prices_full_listing_interval
+            )
+            source = await asyncio.to_thread(
+                self._latest_price_object,
+                None if full_listing else prices_cache.source,
+            )
+            if full_listing:
+                prices_cache.listed_at = time.monotonic()
+            if source is None or source != prices_cache.source:
+                prices = await asyncio.to_thread(
+                    self.s3_client.fetch_latest_price_changes, PRICES_PREFIX
+                )
+                prices_cache.prices = self._index_prices(prices)
+                prices_cache.source = source
+            prices_cache.checked_at = time.monotonic()
+
+    def _latest_price_object(
+        self, seen: Optional[PriceObject]
+    ) -> Optional[PriceObject]:
+        """
+        The key, ETag and last modified time of the newest price file.
+
+        Given the file seen last, only the keys after it are listed and only
+        files modified since it count, so new files are found in one short
+        listing while keys sort in the order they are written. With none,
+        the seen file is checked with a HEAD in case it was overwritten, and
+        the whole prefix is listed if it has gone. refresh_prices also lists
+        the whole prefix every prices_full_listing_interval, so a file whose
+        key sorts before the seen one is still picked up within that time.
+        """
+        if self.s3_object_client is None:
+            return None
+        list_args = {"Bucket": config.do_spaces_bucket_name, "Prefix": PRICES_PREFIX}
+        if seen is not None:
+            list_args["StartAfter"] = seen[0]
+        latest = None
+        pages = self.s3_object_client.get_paginator("list_objects_v2").paginate(
+            **list_args
+        )
+        for page in pages:
+            for item in page.get("Contents", []):
+                if seen is not None and item["LastModified"] <= seen[2]:
+                    continue
+                if latest is None or item["LastModified"] > latest["LastModified"]:
+                    latest = item
+        if latest is not None:
+            return latest["Key"], latest["ETag"], latest["LastModified"]
+        if seen is None:
+            return None
+        try:
+            head = self.s3_object_client.head_object(
+                Bucket=config.do_spaces_bucket_name, Key=seen[0]
+            )
+        except self.s3_object_client.exceptions.ClientError:
+            return self._latest_price_object(None)
+        return seen[0], head["ETag"], head["LastModified"]
+
+    @staticmethod
+    def _index_prices(prices: pd.DataFrame) -> pd.DataFrame:
+        return (
+            prices.drop_duplicates(subset=["horse_id"], keep="last")
+            .set_index("horse_id")
+            .rename_axis("betfair_id")
+        )
+
+
+def get_prices_repository(
+    s3_client: S3Client = Depends(get_s3_client),
+    s3_object_client=Depends(get_s3_object_client),
+):
+    return PricesRepository(s3_client, s3_object_client)
 
 
-def get_prices_repository(s3_client: S3Client = Depends(get_s3_client)):
-    return PricesRepository(s3_client)
+async def refresh_prices():
+    await PricesRepository(get_s3_client(), get_s3_object_client()).refresh_prices()
@@ -1,46 +1,108 @@
-import pandas as pd
 from fastapi import Depends
-from sqlalchemy import text
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from ..helpers.session_manager import get_current_session
+from .base_repository import BaseRepository
+from .frame_schema import PERFORMANCE_SCHEMA
+from .history_store import TODAYS_VIEW, todays_history_store
 
 
-class TodaysRepository:
-    def __init__(self, session: AsyncSession):
-        self.session = session
-
+class TodaysRepository(BaseRepository):
     async def get_todays_races(self):
-        result = await self.session.execute(
-            text(
-                """
-                SELECT DISTINCT ON (course, race_time) *
-                FROM  public.todays_performance_data_mat_vw
-                WHERE data_type = 'today'
-                ORDER BY course, race_time
-                """
-            ),
+        return await self.fetch_frame(
+            """
+            SELECT DISTINCT ON (course, race_time) *
+            FROM  public.todays_performance_data_mat_vw
+            WHERE data_type = 'today'
+            ORDER BY course, race_time
+            """
         )
-        return pd.DataFrame(result.fetchall())
 
     async def get_race_by_id(self, race_id: int):
-        result = await self.session.execute(
-            text(
-                """
-                SELECT pd.*, h.bf_id::integer as betfair_id
+        if todays_history_store.enabled:
+            data = todays_history_store.get_race(
+                race_id, await self.get_performance_data_version()
+            )
+            if data is not None:
+                return PERFORMANCE_SCHEMA.apply(data)
+        return await self.fetch_frame(
+            """
+            SELECT pd.*, h.bf_id::integer as betfair_id
+                FROM public.todays_performance_data_mat_vw pd
+                LEFT JOIN public.horse h
+                on h.id = pd.horse_id
+                WHERE horse_id IN (
+                    SELECT pd.horse_id
                     FROM public.todays_performance_data_mat_vw pd
-					LEFT JOIN public.horse h
-					on h.id = pd.horse_id
-                    WHERE horse_id IN (
-                        SELECT pd.horse_id 
-                        FROM public.todays_performance_data_mat_vw pd
-                        WHERE pd.race_id = :race_id
-                    )
-                 """
-            ),
+                    WHERE pd.race_id = :race_id
+                )
+             """,
+            {"race_id": race_id},
+            PERFORMANCE_SCHEMA,
+        )
+
+    async def get_race_runners(self, race_id: int):
+        return await self.fetch_frame(
+            """
+            SELECT pd.horse_id, pd.horse_name, h.bf_id::integer as betfair_id
+                FROM public.todays_performance_data_mat_vw pd
+                LEFT JOIN public.horse h
+                on h.id = pd.horse_id
+                WHERE pd.race_id = :race_id
+                AND pd.data_type = 'today'
+             """,
             {"race_id": race_id},
+            prepared=True,
+        )
+
+    async def get_races_by_ids(self, race_ids: list[int]):
+        return await self.fetch_frame(
+            """
+            SELECT pd.*, h.bf_id::integer as betfair_id
+                FROM public.todays_performance_data_mat_vw pd
+                LEFT JOIN public.horse h
+                on h.id = pd.horse_id
+                WHERE horse_id IN (
+                    SELECT pd.horse_id
+                    FROM public.todays_performance_data_mat_vw pd
+                    WHERE pd.race_id = ANY(:race_ids)
+                )
+             """,
+            {"race_ids": race_ids},
+            PERFORMANCE_SCHEMA,
         )
-        return pd.DataFrame(result.fetchall())
+
+    async def get_races_by_course_id(self, course_id: int):
+        return await self.fetch_frame(
+            """
+            SELECT pd.*, h.bf_id::integer as betfair_id
+                FROM public.todays_performance_data_mat_vw pd
+                LEFT JOIN public.horse h
+                on h.id = pd.horse_id
+                WHERE horse_id IN (
+                    SELECT pd.horse_id
+                    FROM public.todays_performance_data_mat_vw pd
+                    WHERE pd.course_id = :course_id
+                    AND pd.data_type = 'today'
+                )
+             """,
+            {"course_id": course_id},
+            PERFORMANCE_SCHEMA,
+        )
+
+    async def get_todays_performance_data(self):
+        return await self.fetch_frame(
+            """
+            SELECT pd.*, h.bf_id::integer as betfair_id
+                FROM public.todays_performance_data_mat_vw pd
+                LEFT JOIN public.horse h
+                on h.id = pd.horse_id
+             """,
+            schema=PERFORMANCE_SCHEMA,
+        )
+
+    async def get_performance_data_version(self) -> str:
+        return await self.get_view_version(TODAYS_VIEW)
 
 
 def get_todays_repository(session: AsyncSession = Depends(get_current_session)):
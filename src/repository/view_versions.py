@@ -0,0 +1,56 @@
+from typing import Optional
+
+from sqlalchemy import text
+
+from ..helpers.conditional import entity_tag
+from ..helpers.session_manager import background_session
+from .base_repository import BaseRepository
+from .history_store import FEEDBACK_VIEW, TODAYS_VIEW
+
+
+class ViewVersionRepository(BaseRepository):
+    async def get_feedback_date(self) -> str:
+        result = await self.session.execute(
+            text("SELECT today_date FROM public.feedback_date")
+        )
+        return str(result.scalar_one())
+
+
+class ViewVersions:
+    """
+    The versions of the materialized views last seen by the background
+    refresh, kept in memory so conditional requests can be answered
+    without a query.
+
+    Feedback tags also carry the feedback date. Every tag is None until the
+    first refresh. The today's races list takes its tag from
+    todays_races_index instead, whose version can trail this one.
+    """
+
+    def __init__(self):
+        self.todays: Optional[str] = None
+        self.feedback: Optional[str] = None
+        self.feedback_date: Optional[str] = None
+
+    async def refresh(self, repository: ViewVersionRepository) -> None:
+        self.todays = await repository.get_view_version(TODAYS_VIEW)
+        self.feedback_date = await repository.get_feedback_date()
+        self.feedback = await repository.get_view_version(FEEDBACK_VIEW)
+
+    def todays_tag(self, *parts) -> Optional[str]:
+        if self.todays is None:
+            return None
+        return entity_tag(TODAYS_VIEW, self.todays, *parts)
+
+    def feedback_tag(self, *parts) -> Optional[str]:
+        if self.feedback is None:
+            return None
+        return entity_tag(FEEDBACK_VIEW, self.feedback, self.feedback_date, *parts)
+
+
+view_versions = ViewVersions()
+
+
+async def refresh_view_versions():
+    async with background_session() as session:
+        await view_versions.refresh(ViewVersionRepository(session))
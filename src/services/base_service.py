@@ -1,9 +1,20 @@
-from datetime import timedelta
-from typing import Callable
+import base64
+from datetime import date, timedelta
+from typing import Callable, Optional
 
 import numpy as np
+import orjson
 import pandas as pd
 
+from ..helpers.arrow import encode_table, frame_table
+from ..helpers.serialization import dumps, frame_records
+from ..helpers.timing import timed
+from ..models.form_data import (
+    TodaysHorseFormData,
+    TodaysPerformanceDataResponse,
+    TodaysRaceFormData,
+)
+
 
 FILTER_WEEKS = 52
 FILTER_YEARS = 3
@@ -50,6 +61,14 @@ class BaseService:
         ]
 
     def format_todays_races(self, data: pd.DataFrame) -> list[dict]:
+        return [
+            {
+                "race_date": data["race_date"].iloc[0],
+                "courses": self.group_todays_races(data),
+            }
+        ]
+
+    def group_todays_races(self, data: pd.DataFrame) -> list[dict]:
         data = data.assign(
             race_class=data["race_class"].fillna(0).astype(int).replace(0, None)
         )
@@ -69,37 +88,70 @@ class BaseService:
             }
             courses.append(course_info)
 
-        return [
-            {
-                "race_date": data["race_date"].iloc[0],
-                "courses": courses,
-            }
-        ]
+        return courses
 
     def convert_string_columns(
         self, data: pd.DataFrame, columns: list[str]
     ) -> pd.DataFrame:
         for column in columns:
-            data[column] = data[column].astype(str)
+            values = data[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                data[column] = self._categorical_strings(values)
+            elif isinstance(values.dtype, pd.StringDtype):
+                data[column] = values.fillna("None")
+            else:
+                data[column] = values.astype(str)
         return data
 
+    @staticmethod
+    def _categorical_strings(values: pd.Series) -> pd.Series:
+        """
+        astype(str) for a categorical, done on its categories so the codes
+        are kept, with missing values as "None".
+        """
+        categories = values.cat.categories.astype(str)
+        if not categories.is_unique:
+            return values.astype(object).where(values.notna(), None).astype(str)
+        values = values.cat.rename_categories(categories)
+        if values.isna().any():
+            if "None" not in categories:
+                values = values.cat.add_categories("None")
+            values = values.fillna("None")
+        return values
+
     def convert_integer_columns(
         self, data: pd.DataFrame, columns: list[str]
     ) -> pd.DataFrame:
         for column in columns:
-            data[column] = pd.to_numeric(data[column], errors="coerce").fillna(0)
-            data[column] = data[column].astype("Int64")
+            values = pd.to_numeric(data[column], errors="coerce").fillna(0)
+            narrow = values.dtype in (np.int8, np.int16, np.int32)
+            data[column] = values.astype("Int32" if narrow else "Int64")
         return data
 
     def format_todays_form_data(
         self,
         data: pd.DataFrame,
         transformation_function: Callable,
+        runs: Optional[int] = None,
     ) -> list[dict]:
+        data = self.transform_todays_form_data(data, transformation_function)
+        return self.build_todays_form_data(data, runs)
+
+    def transform_todays_form_data(
+        self,
+        data: pd.DataFrame,
+        transformation_function: Callable,
+    ) -> pd.DataFrame:
+        data, date = self.filter_form_period(data)
+        return self.convert_form_data_columns(data.pipe(transformation_function, date))
+
+    def filter_form_period(self, data: pd.DataFrame) -> tuple[pd.DataFrame, date]:
         date = data[data["data_type"] == "today"]["race_date"].iloc[0]
         date_filter = date - timedelta(weeks=FILTER_PERIOD)
-        data = data[data["race_date"] > date_filter]
-        data = data.pipe(transformation_function, date)
+        return data[data["race_date"] > date_filter], date
+
+    @timed("convert")
+    def convert_form_data_columns(self, data: pd.DataFrame) -> pd.DataFrame:
         data.pipe(
             self.convert_string_columns,
             [
@@ -140,11 +192,10 @@ class BaseService:
             ],
         )
         data = data.assign(
-            headgear=data["headgear"].replace("None", None),
+            headgear=data["headgear"].mask(data["headgear"] == "None"),
             official_rating=data["official_rating"].fillna(0).astype("Int64"),
-            price_change=data["price_change"].fillna(0).round(0).astype(int),
         )
-        data = data.assign(
+        return data.assign(
             official_rating_diff=np.select(
                 [
                     data["official_rating"] == 0,
@@ -158,16 +209,141 @@ class BaseService:
             )
         )
 
+    @timed("build")
+    def build_todays_form_data(
+        self, data: pd.DataFrame, runs: Optional[int] = None
+    ) -> dict:
+        today, combined_data = self.combine_todays_form_data(data)
+        next_cursors = {}
+        if runs is not None:
+            combined_data, next_cursors = self.latest_runs(combined_data, runs)
+        horse_numbers = combined_data.groupby(
+            ["horse_id", "horse_name"], sort=False, dropna=False, observed=True
+        ).ngroup()
+        horse_data = frame_records(
+            combined_data.drop_duplicates(subset=["horse_id", "horse_name"]),
+            TodaysPerformanceDataResponse,
+        )
+        for horse in horse_data:
+            horse["performance_data"] = []
+            horse["next_cursor"] = next_cursors.get(horse["horse_id"])
+        for horse_number, performance in zip(
+            horse_numbers.tolist(),
+            frame_records(combined_data, TodaysHorseFormData),
+        ):
+            horse_data[horse_number]["performance_data"].append(performance)
+
+        race_data = frame_records(today.iloc[:1], TodaysRaceFormData)[0]
+        race_data["horse_data"] = horse_data
+        return race_data
+
+    @staticmethod
+    def latest_runs(
+        data: pd.DataFrame, runs: int
+    ) -> tuple[pd.DataFrame, dict[int, str]]:
+        """
+        Each horse's today row and its latest ``runs`` historical runs, with
+        a cursor to the older runs of every horse that has more.
+        """
+        data = data.reset_index(drop=True)
+        historical = data[data["data_type"] == "historical"].sort_values(
+            by=["horse_id", "race_time", "unique_id"], ascending=[True, False, False]
+        )
+        position = historical.groupby("horse_id").cumcount()
+        last_shown = historical[position == runs - 1]
+        has_more = last_shown["horse_id"].isin(
+            historical.loc[position == runs, "horse_id"]
+        )
+        next_cursors = {
+            int(run.horse_id): encode_runs_cursor(run.race_time, run.unique_id)
+            for run in last_shown[has_more].itertuples()
+        }
+        shown = (
+            data.index.isin(historical.index[position < runs])
+            | (data["data_type"] == "today").to_numpy()
+        )
+        return data[shown], next_cursors
+
+    def format_horse_form_page(
+        self,
+        data: pd.DataFrame,
+        transformation_function: Callable,
+        horse_id: int,
+        cursor: Optional[tuple[pd.Timestamp, str]],
+        limit: int,
+    ) -> dict:
+        data = self.transform_todays_form_data(data, transformation_function)
+        return self.build_horse_form_page(data, horse_id, cursor, limit)
+
+    @timed("build")
+    def build_horse_form_page(
+        self,
+        data: pd.DataFrame,
+        horse_id: int,
+        cursor: Optional[tuple[pd.Timestamp, str]],
+        limit: int,
+    ) -> dict:
+        """
+        One page of a horse's historical runs in a race's form, newest first,
+        starting after ``cursor``.
+        """
+        _, combined_data = self.combine_todays_form_data(
+            data[data["horse_id"] == horse_id]
+        )
+        runs = combined_data[combined_data["data_type"] == "historical"].sort_values(
+            by=["race_time", "unique_id"], ascending=False
+        )
+        if cursor is not None:
+            race_time, unique_id = cursor
+            runs = runs[
+                (runs["race_time"] < race_time)
+                | ((runs["race_time"] == race_time) & (runs["unique_id"] < unique_id))
+            ]
+        page = runs.iloc[:limit]
+        return {
+            "horse_id": horse_id,
+            "performance_data": frame_records(page, TodaysHorseFormData),
+            "next_cursor": (
+                encode_runs_cursor(page["race_time"].iat[-1], page["unique_id"].iat[-1])
+                if len(runs) > limit
+                else None
+            ),
+        }
+
+    def format_todays_form_table(
+        self,
+        data: pd.DataFrame,
+        transformation_function: Callable,
+        media_type: str,
+    ) -> bytes:
+        data = self.transform_todays_form_data(data, transformation_function)
+        return self.encode_todays_form_table(data, media_type)
+
+    def encode_todays_form_table(self, data: pd.DataFrame, media_type: str) -> bytes:
+        today, combined_data = self.combine_todays_form_data(data)
+        race_data = frame_records(today.iloc[:1], TodaysRaceFormData)[0]
+        return encode_table(
+            frame_table(
+                combined_data,
+                [TodaysPerformanceDataResponse, TodaysHorseFormData],
+                race_data,
+            ),
+            media_type,
+        )
+
+    def combine_todays_form_data(
+        self, data: pd.DataFrame
+    ) -> tuple[pd.DataFrame, pd.DataFrame]:
+        data = data.assign(
+            price_change=data["price_change"].fillna(0).round(0).astype(int),
+        )
+
         today = data[data["data_type"] == "today"].sort_values(
             by=["race_id", "betfair_win_sp"], ascending=[True, True]
         )
         today["horse_number"] = today.groupby("race_id").cumcount() + 1
         historical = data[data["data_type"] == "historical"]
 
-        race_details = today.drop_duplicates(subset=["unique_id"]).to_dict(
-            orient="records"
-        )[0]
-
         today = today.assign(
             todays_horse_age=today["age"],
             todays_official_rating=today["official_rating"],
@@ -204,80 +380,73 @@ class BaseService:
             ],
             on="horse_id",
         )
-        print("historical")
-        print(historical.info())
-        print("today")
-        print(today.info())
 
         combined_data = pd.concat([historical, today]).sort_values(
             by=["todays_betfair_win_sp", "horse_id", "race_date"],
             ascending=[True, True, False],
         )
-        print("combined")
-        print(combined_data.info())
-        grouped = combined_data.groupby(["horse_id", "horse_name"], sort=False)
-
-        data = {
-            "race_id": race_details["race_id"],
-            "course": race_details["course"],
-            "distance": race_details["distance"],
-            "going": race_details["going"],
-            "surface": race_details["surface"],
-            "race_class": race_details["race_class"],
-            "hcap_range": race_details["hcap_range"],
-            "age_range": race_details["age_range"],
-            "conditions": race_details["conditions"],
-            "first_place_prize_money": race_details["first_place_prize_money"],
-            "race_type": race_details["race_type"],
-            "race_title": race_details["race_title"],
-            "race_time": race_details["race_time"],
-            "race_date": race_details["race_date"],
-            "horse_data": [
-                {
-                    "horse_name": name,
-                    "horse_id": horse_id,
-                    "todays_horse_number": group["todays_horse_number"].iloc[0],
-                    "todays_horse_age": group["todays_horse_age"].iloc[0],
-                    "todays_first_places": group["todays_first_places"].iloc[0],
-                    "todays_second_places": group["todays_second_places"].iloc[0],
-                    "todays_third_places": group["todays_third_places"].iloc[0],
-                    "todays_fourth_places": group["todays_fourth_places"].iloc[0],
-                    "number_of_runs": group["number_of_runs"].iloc[0],
-                    "todays_betfair_win_sp": group["todays_betfair_win_sp"].iloc[0],
-                    "todays_betfair_place_sp": group["todays_betfair_place_sp"].iloc[0],
-                    "todays_price_change": group["todays_price_change"].iloc[0],
-                    "todays_official_rating": group["todays_official_rating"].iloc[0],
-                    "todays_days_since_last_ran": (
-                        None
-                        if pd.isna(group["todays_days_since_last_ran"].iloc[0])
-                        else int(group["todays_days_since_last_ran"].iloc[0])
-                    ),
-                    "performance_data": group.drop(
-                        columns=[
-                            "horse_id",
-                            "horse_name",
-                            "first_places",
-                            "second_places",
-                            "third_places",
-                            "fourth_places",
-                            "todays_betfair_win_sp",
-                            "todays_betfair_place_sp",
-                            "todays_price_change",
-                        ]
-                    ).to_dict(orient="records"),
-                }
-                for (horse_id, name), group in grouped
-            ],
-        }
+        return today, combined_data
 
-        return self.sanitize_nan(data)
 
-    def sanitize_nan(self, data):
-        """Replace NaN values with None in nested structures."""
-        if isinstance(data, dict):
-            return {k: self.sanitize_nan(v) for k, v in data.items()}
-        elif isinstance(data, list):
-            return [self.sanitize_nan(item) for item in data]
-        elif isinstance(data, float) and np.isnan(data):
-            return None
-        return data
+# Entry points for worker_pool. Each returns the encoded response, so a
+# worker sends bytes back instead of pickling the nested response.
+
+
+def format_todays_form_data(
+    data: pd.DataFrame, transformation_function: Callable, runs: Optional[int] = None
+) -> bytes:
+    return dumps(
+        BaseService().format_todays_form_data(data, transformation_function, runs)
+    )
+
+
+def build_todays_form_data(data: pd.DataFrame, runs: Optional[int] = None) -> bytes:
+    return dumps(BaseService().build_todays_form_data(data, runs))
+
+
+def format_horse_form_page(
+    data: pd.DataFrame,
+    transformation_function: Callable,
+    horse_id: int,
+    cursor: Optional[tuple[pd.Timestamp, str]],
+    limit: int,
+) -> bytes:
+    return dumps(
+        BaseService().format_horse_form_page(
+            data, transformation_function, horse_id, cursor, limit
+        )
+    )
+
+
+def build_horse_form_page(
+    data: pd.DataFrame,
+    horse_id: int,
+    cursor: Optional[tuple[pd.Timestamp, str]],
+    limit: int,
+) -> bytes:
+    return dumps(BaseService().build_horse_form_page(data, horse_id, cursor, limit))
+
+
+def format_todays_form_table(
+    data: pd.DataFrame, transformation_function: Callable, media_type: str
+) -> bytes:
+    return BaseService().format_todays_form_table(
+        data, transformation_function, media_type
+    )
+
+
+def encode_todays_form_table(data: pd.DataFrame, media_type: str) -> bytes:
+    return BaseService().encode_todays_form_table(data, media_type)
+
+
+def encode_runs_cursor(race_time: pd.Timestamp, unique_id: str) -> str:
+    cursor = dumps([race_time, unique_id])
+    return base64.urlsafe_b64encode(cursor).decode()
+
+
+def decode_runs_cursor(cursor: str) -> tuple[pd.Timestamp, str]:
+    try:
+        race_time, unique_id = orjson.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return pd.Timestamp(race_time), str(unique_id)
+    except (ValueError, TypeError) as error:
+        raise ValueError(f"Invalid cursor: {cursor}") from error
@@ -0,0 +1,130 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Optional
+
+import orjson
+import pandas as pd
+import pyarrow as pa
+
+from ..config import config
+from ..repository.history_store import read_table, write_table
+
+MANIFEST = "ledger.jsonl"
+
+
+class BettingLedger:
+    """
+    Append-only store of settled bets with their running totals.
+
+    The ledger remembers how many selections_info rows it was built from up
+    to settled_through, so a changed history can be detected and rebuilt.
+
+    On disk each append is its own Arrow IPC file, committed by a line added
+    to a JSON lines manifest with the batch's source rows and settled_through,
+    so an append writes only the new bets. A batch file with no manifest line
+    and a torn last line are ignored on load. File I/O runs in a thread.
+    """
+
+    def __init__(self, path: str):
+        self.directory = path
+        self.lock = asyncio.Lock()
+        self.loaded = False
+        self._reset()
+
+    def _reset(self) -> None:
+        self.bets = pd.DataFrame()
+        self.batches = 0
+        self.source_rows = 0
+        self.settled_through: Optional[datetime] = None
+
+    async def load(self) -> None:
+        if self.loaded:
+            return
+        await asyncio.to_thread(self._read)
+        self.loaded = True
+
+    async def clear(self) -> None:
+        self._reset()
+        await asyncio.to_thread(self._remove)
+
+    async def append(
+        self, bets: pd.DataFrame, source_rows: int, settled_through: datetime
+    ) -> None:
+        await asyncio.to_thread(
+            self._write, self.batches, bets, source_rows, settled_through
+        )
+        self.bets = (
+            bets
+            if self.bets.empty
+            else pd.concat([self.bets, bets], ignore_index=True)
+        )
+        self.batches += 1
+        self.source_rows += source_rows
+        self.settled_through = settled_through
+
+    def _read(self) -> None:
+        manifest_path = os.path.join(self.directory, MANIFEST)
+        if not os.path.exists(manifest_path):
+            return
+        with open(manifest_path, "rb") as f:
+            lines = f.read().splitlines(keepends=True)
+        batches = []
+        committed = 0
+        for line in lines:
+            try:
+                batches.append(orjson.loads(line))
+            except orjson.JSONDecodeError:
+                with open(manifest_path, "r+b") as f:
+                    f.truncate(committed)
+                break
+            committed += len(line)
+        if not batches:
+            return
+        self.bets = pd.concat(
+            [read_table(self._batch_path(b["batch"])).to_pandas() for b in batches],
+            ignore_index=True,
+        )
+        self.batches = len(batches)
+        self.source_rows = sum(b["source_rows"] for b in batches)
+        self.settled_through = datetime.fromisoformat(batches[-1]["settled_through"])
+
+    def _write(
+        self,
+        batch: int,
+        bets: pd.DataFrame,
+        source_rows: int,
+        settled_through: datetime,
+    ) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        write_table(
+            self._batch_path(batch), pa.Table.from_pandas(bets, preserve_index=False)
+        )
+        line = orjson.dumps(
+            {
+                "batch": batch,
+                "source_rows": source_rows,
+                "settled_through": settled_through,
+            },
+            option=orjson.OPT_APPEND_NEWLINE,
+        )
+        with open(os.path.join(self.directory, MANIFEST), "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _remove(self) -> None:
+        if not os.path.isdir(self.directory):
+            return
+        manifest_path = os.path.join(self.directory, MANIFEST)
+        if os.path.exists(manifest_path):
+            os.remove(manifest_path)
+        for name in os.listdir(self.directory):
+            if name.startswith("bets-") and name.endswith(".arrow"):
+                os.remove(os.path.join(self.directory, name))
+
+    def _batch_path(self, batch: int) -> str:
+        return os.path.join(self.directory, f"bets-{batch:06d}.arrow")
+
+
+betting_ledger = BettingLedger(config.betting_ledger_path)
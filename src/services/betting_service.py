@@ -1,13 +1,29 @@
+import asyncio
+import base64
 import json
+from typing import Iterator, Optional
+
+import orjson
 
 import numpy as np
 import pandas as pd
 from fastapi import Depends
 
-from src.models.betting_selections import BettingSelections
+from src.models.betting_selections import (
+    BettingSelections,
+    BettingSelectionsAnalysis,
+    BettingSelectionsFilter,
+)
 
+from ..helpers.logging_config import logger
+from ..helpers.serialization import dumps, dumps_lines, frame_records
+from ..helpers.session_manager import background_session
+from ..helpers.timing import timed
 from ..repository.betting_repository import BettingRepository, get_betting_repository
 from .base_service import BaseService
+from .betting_ledger import betting_ledger
+
+STREAM_CHUNK_SIZE = 1000
 
 
 class BettingService(BaseService):
@@ -24,16 +40,69 @@ class BettingService(BaseService):
             self.betting_session_id = int(session_id) + 1
 
     async def store_betting_selections(self, selections: BettingSelections):
+        await wait_for_selections_info_update()
         await self.betting_repository.store_betting_selections(
             selections, self.betting_session_id
         )
+        schedule_selections_info_update()
+
+    async def get_betting_selections_analysis(
+        self, filters: Optional[BettingSelectionsFilter] = None
+    ):
+        return self._summarise_bets(await self._get_settled_bets(), filters)
+
+    async def stream_betting_selections_analysis(
+        self, filters: Optional[BettingSelectionsFilter] = None
+    ) -> Iterator[bytes]:
+        """
+        Settle the ledger, then return the analysis as newline delimited
+        JSON: the summary on the first line and one settled bet per line,
+        encoded a chunk at a time as the response is sent.
+        """
+        bets = await self._get_settled_bets()
+        return self._stream_bets(bets, filters)
 
-    async def get_betting_selections_analysis(self):
-        data = await self.betting_repository.get_betting_selections_analysis()
-        data = data.pipe(self._calculate_dutch_sum)
-        return data
+    async def _get_settled_bets(self) -> pd.DataFrame:
+        await wait_for_selections_info_update()
+        async with betting_ledger.lock:
+            await betting_ledger.load()
+            await self._update_ledger()
+            return betting_ledger.bets
 
-    def _calculate_dutch_sum(self, data: pd.DataFrame) -> pd.DataFrame:
+    async def _update_ledger(self) -> None:
+        if betting_ledger.settled_through is not None:
+            source_rows = await self.betting_repository.count_selections_info(
+                betting_ledger.settled_through
+            )
+            if source_rows != betting_ledger.source_rows:
+                await betting_ledger.clear()
+
+        data = await self.betting_repository.get_betting_selections_analysis(
+            betting_ledger.settled_through
+        )
+        unsettled = data["finishing_position"].isna()
+        if unsettled.any():
+            data = data[data["created_at"] < data.loc[unsettled, "created_at"].min()]
+        if data.empty:
+            return
+
+        if not betting_ledger.bets.empty and (
+            data["race_id"].isin(betting_ledger.bets["race_id"]).any()
+        ):
+            await betting_ledger.clear()
+            return await self._update_ledger()
+
+        await betting_ledger.append(
+            self._accumulate_bets(self._settle_bets(data), betting_ledger.bets),
+            source_rows=len(data),
+            settled_through=data["created_at"].max().to_pydatetime(),
+        )
+
+    def _calculate_dutch_sum(self, data: pd.DataFrame) -> dict:
+        return self._summarise_bets(self._accumulate_bets(self._settle_bets(data)))
+
+    @timed("settle")
+    def _settle_bets(self, data: pd.DataFrame) -> pd.DataFrame:
         data["betfair_win_sp"] = data["betfair_win_sp"].astype(float)
         data["dutch_sum"] = (
             data[data["betting_type"].str.contains("dutch", case=False)]
@@ -161,34 +230,188 @@ class BettingService(BaseService):
             subset=["race_id"], keep="first"
         )
 
-        result = pd.concat([dutch_bets_deduplicated, non_dutch_bets]).sort_index()
-        result["bet_number"] = result.groupby("betting_type").cumcount() + 1
-        result["running_total"] = result.groupby("betting_type")["bet_result"].cumsum()
-        result["overall_total"] = result["bet_result"].cumsum()
-        overall_total = result["overall_total"].iloc[-1]
-        number_of_bets = len(result)
-        session_results = result[result["session_id"] == self.betting_session_id]
-        session_results["overall_total"] = session_results["bet_result"].cumsum()
-        if len(session_results) > 0:
-            session_overall_total = session_results["overall_total"].iloc[-1]
-            session_number_of_bets = len(session_results)
-        else:
-            session_overall_total = 0
-            session_number_of_bets = 0
+        return pd.concat([dutch_bets_deduplicated, non_dutch_bets]).sort_index()
 
-        result = result.sort_values(["betting_type", "created_at"])
-        result_dict = self.sanitize_nan(result.to_dict(orient="records"))
+    @staticmethod
+    def _accumulate_bets(
+        bets: pd.DataFrame, previous: Optional[pd.DataFrame] = None
+    ) -> pd.DataFrame:
+        by_type = bets.groupby("betting_type")
+        bets = bets.reset_index(drop=True).assign(
+            bet_number=by_type.cumcount().to_numpy() + 1,
+            running_total=by_type["bet_result"].cumsum().to_numpy(),
+            overall_total=bets["bet_result"].cumsum().to_numpy(),
+            session_total=bets.groupby("session_id")["bet_result"]
+            .cumsum()
+            .to_numpy(),
+        )
+        if previous is None or previous.empty:
+            return bets
+
+        last_by_type = previous.groupby("betting_type")[
+            ["bet_number", "running_total"]
+        ].last()
+        last_by_session = previous.groupby("session_id")["session_total"].last()
+        previous_bet_numbers = bets["betting_type"].map(last_by_type["bet_number"])
+        previous_running_totals = bets["betting_type"].map(
+            last_by_type["running_total"]
+        )
+        previous_session_totals = bets["session_id"].map(last_by_session)
+        return bets.assign(
+            bet_number=bets["bet_number"]
+            + previous_bet_numbers.fillna(0).astype(int),
+            running_total=bets["running_total"] + previous_running_totals.fillna(0),
+            overall_total=bets["overall_total"] + previous["overall_total"].iloc[-1],
+            session_total=bets["session_total"] + previous_session_totals.fillna(0),
+        )
 
+    @timed("build")
+    def _summarise_bets(
+        self, bets: pd.DataFrame, filters: Optional[BettingSelectionsFilter] = None
+    ) -> dict:
+        bets = self._filter_bets(bets, filters)
+        order, next_cursor = self._page_order(bets, filters)
         return {
-            "number_of_bets": number_of_bets,
-            "overall_total": overall_total,
-            "session_number_of_bets": session_number_of_bets,
-            "session_overall_total": session_overall_total,
-            "result_dict": result_dict,
+            **self._summary(bets),
+            "next_cursor": next_cursor,
+            "result_dict": (
+                []
+                if not len(order)
+                else frame_records(bets.take(order), BettingSelectionsAnalysis)
+            ),
         }
 
+    def _stream_bets(
+        self, bets: pd.DataFrame, filters: Optional[BettingSelectionsFilter] = None
+    ) -> Iterator[bytes]:
+        bets = self._filter_bets(bets, filters)
+        order, next_cursor = self._page_order(bets, filters)
+        yield dumps({**self._summary(bets), "next_cursor": next_cursor}) + b"\n"
+        for start in range(0, len(order), STREAM_CHUNK_SIZE):
+            chunk = bets.take(order[start : start + STREAM_CHUNK_SIZE])
+            yield dumps_lines(frame_records(chunk, BettingSelectionsAnalysis))
+
+    def _filter_bets(
+        self, bets: pd.DataFrame, filters: Optional[BettingSelectionsFilter]
+    ) -> pd.DataFrame:
+        """
+        Keep the settled bets matching the filters, with the bet numbers and
+        running totals counted again from the start of the filtered window.
+        """
+        if bets.empty or filters is None:
+            return bets
+        mask = np.ones(len(bets), dtype=bool)
+        if filters.betting_types:
+            mask &= bets["betting_type"].isin(filters.betting_types).to_numpy()
+        if filters.session_id is not None:
+            mask &= (bets["session_id"] == filters.session_id).to_numpy()
+        if filters.date_from is not None or filters.date_to is not None:
+            race_dates = pd.to_datetime(bets["race_date"])
+            if filters.date_from is not None:
+                mask &= (race_dates >= pd.Timestamp(filters.date_from)).to_numpy()
+            if filters.date_to is not None:
+                mask &= (race_dates <= pd.Timestamp(filters.date_to)).to_numpy()
+        if mask.all():
+            return bets
+        window = bets[mask]
+        return window if window.empty else self._accumulate_bets(window)
+
+    @staticmethod
+    def _page_order(
+        bets: pd.DataFrame, filters: Optional[BettingSelectionsFilter]
+    ) -> tuple[np.ndarray, Optional[str]]:
+        """
+        Row positions of the bets in betting_type and created_at order,
+        starting after the cursor and cut at the limit, with the cursor for
+        the following page.
+        """
+        if bets.empty:
+            return np.array([], dtype=int), None
+        keys = bets[["betting_type", "created_at"]].reset_index(drop=True)
+        order = keys.sort_values(["betting_type", "created_at"]).index.to_numpy()
+        if filters is None:
+            return order, None
+
+        if filters.cursor is not None:
+            betting_type, created_at, position = filters.cursor
+            created_at = pd.Timestamp(created_at)
+            types = keys["betting_type"].to_numpy()[order]
+            times = keys["created_at"].to_numpy()[order]
+            after = (types > betting_type) | (
+                (types == betting_type)
+                & (
+                    (times > created_at.to_datetime64())
+                    | ((times == created_at.to_datetime64()) & (order > position))
+                )
+            )
+            order = order[after]
+
+        if filters.limit is None or len(order) <= filters.limit:
+            return order, None
+        order = order[: filters.limit]
+        last = order[-1]
+        return order, encode_cursor(
+            keys["betting_type"].iat[last], keys["created_at"].iat[last], last
+        )
+
+    def _summary(self, bets: pd.DataFrame) -> dict:
+        if bets.empty:
+            return {
+                "number_of_bets": 0,
+                "overall_total": 0,
+                "session_number_of_bets": 0,
+                "session_overall_total": 0,
+            }
+        session_results = bets[bets["session_id"] == self.betting_session_id]
+        return {
+            "number_of_bets": len(bets),
+            "overall_total": bets["overall_total"].iloc[-1],
+            "session_number_of_bets": len(session_results),
+            "session_overall_total": (
+                session_results["session_total"].iloc[-1]
+                if len(session_results) > 0
+                else 0
+            ),
+        }
+
+
+def encode_cursor(betting_type: str, created_at: pd.Timestamp, position: int) -> str:
+    cursor = dumps([betting_type, created_at, int(position)])
+    return base64.urlsafe_b64encode(cursor).decode()
+
+
+def decode_cursor(cursor: str) -> tuple:
+    try:
+        betting_type, created_at, position = orjson.loads(
+            base64.urlsafe_b64decode(cursor.encode())
+        )
+    except (ValueError, TypeError) as error:
+        raise ValueError(f"Invalid cursor: {cursor}") from error
+    return betting_type, created_at, position
+
 
 def get_betting_service(
     betting_repository: BettingRepository = Depends(get_betting_repository),
 ):
     return BettingService(betting_repository)
+
+
+selections_info_update: Optional[asyncio.Task] = None
+
+
+async def update_selections_info():
+    try:
+        async with background_session() as session:
+            await BettingRepository(session).update_selections_info()
+    except Exception as error:
+        logger.exception(f"Failed to update selections info: {error}")
+
+
+def schedule_selections_info_update() -> None:
+    global selections_info_update
+    selections_info_update = asyncio.create_task(update_selections_info())
+
+
+async def wait_for_selections_info_update() -> None:
+    if selections_info_update is not None:
+        await asyncio.shield(selections_info_update)
@@ -0,0 +1,29 @@
+from collections import OrderedDict
+from typing import Optional
+
+import pandas as pd
+
+from ..config import config
+
+CollateralKey = tuple[str, int, str]
+
+
+class CollateralCache:
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.frames: OrderedDict[CollateralKey, pd.DataFrame] = OrderedDict()
+
+    def get(self, key: CollateralKey) -> Optional[pd.DataFrame]:
+        data = self.frames.get(key)
+        if data is not None:
+            self.frames.move_to_end(key)
+        return data
+
+    def put(self, key: CollateralKey, data: pd.DataFrame) -> None:
+        self.frames[key] = data
+        self.frames.move_to_end(key)
+        while len(self.frames) > self.max_size:
+            self.frames.popitem(last=False)
+
+
+collateral_cache = CollateralCache(config.collateral_cache_size)
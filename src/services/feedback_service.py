@@ -1,7 +1,17 @@
+from typing import Optional
+
+import pandas as pd
 from fastapi import Depends
 
+from ..helpers.worker_pool import worker_pool
+
 from ..repository.feedback_repository import FeedbackRepository, get_feedback_repository
-from .base_service import BaseService
+from .base_service import (
+    BaseService,
+    format_horse_form_page,
+    format_todays_form_data,
+    format_todays_form_table,
+)
 from .transformation_service import TransformationService
 
 
@@ -18,11 +28,42 @@ class FeedbackService(BaseService):
         data = await self.feedback_repository.get_todays_races()
         return self.format_todays_races(data)
 
-    async def get_race_by_id(self, race_id: int):
+    async def get_race_by_id(self, race_id: int, runs: Optional[int] = None):
+        data = await self.feedback_repository.get_race_by_id(race_id)
+        return await worker_pool.run(
+            format_todays_form_data,
+            data,
+            self.transformation_service.calculate,
+            runs,
+        )
+
+    async def get_horse_form(
+        self,
+        race_id: int,
+        horse_id: int,
+        cursor: Optional[tuple[pd.Timestamp, str]],
+        limit: int,
+    ) -> Optional[bytes]:
+        data = await self.feedback_repository.get_race_by_id(race_id)
+        horse_form = data[data["horse_id"] == horse_id]
+        if horse_form.empty:
+            return None
+        return await worker_pool.run(
+            format_horse_form_page,
+            horse_form,
+            self.transformation_service.calculate,
+            horse_id,
+            cursor,
+            limit,
+        )
+
+    async def get_race_table_by_id(self, race_id: int, media_type: str) -> bytes:
         data = await self.feedback_repository.get_race_by_id(race_id)
-        return self.format_todays_form_data(
+        return await worker_pool.run(
+            format_todays_form_table,
             data,
             self.transformation_service.calculate,
+            media_type,
         )
 
     async def get_race_result_by_id(self, race_id: int):
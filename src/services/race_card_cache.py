@@ -0,0 +1,19 @@
+from typing import Optional
+
+import pandas as pd
+
+
+class RaceCardCache:
+    def __init__(self):
+        self.version: Optional[str] = None
+        self.races: dict[int, pd.DataFrame] = {}
+
+    def get(self, race_id: int) -> Optional[pd.DataFrame]:
+        return self.races.get(race_id)
+
+    def replace(self, version: str, races: dict[int, pd.DataFrame]) -> None:
+        self.races = races
+        self.version = version
+
+
+race_card_cache = RaceCardCache()
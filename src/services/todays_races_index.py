@@ -0,0 +1,67 @@
+import bisect
+from datetime import date, datetime
+from typing import Optional
+
+from ..helpers.conditional import entity_tag
+from ..repository.history_store import TODAYS_VIEW
+
+
+class TodaysRacesIndex:
+    """
+    Today's races grouped by course, built once per version of the view.
+
+    Each course keeps its races sorted by race_time with the times
+    alongside, so the races still to run are found with a binary search
+    per course instead of reloading and filtering the card. The ETag for
+    the list is taken from the index too, from its version and the number
+    of races already started, so it always describes the body served.
+    """
+
+    def __init__(self):
+        self.version: Optional[str] = None
+        self.race_date: Optional[date] = None
+        self.courses: list[dict] = []
+        self.race_times: list[list[datetime]] = []
+        self.started: list[datetime] = []
+
+    def replace(
+        self, version: str, race_date: Optional[date], courses: list[dict]
+    ) -> None:
+        courses = [
+            {**course, "races": sorted(course["races"], key=lambda r: r["race_time"])}
+            for course in courses
+        ]
+        self.race_times = [
+            [race["race_time"] for race in course["races"]] for course in courses
+        ]
+        self.started = sorted(
+            race_time for race_times in self.race_times for race_time in race_times
+        )
+        self.courses = courses
+        self.race_date = race_date
+        self.version = version
+
+    def is_stale(self, version: Optional[str]) -> bool:
+        return self.version is None or (
+            version is not None and version != self.version
+        )
+
+    def tag(self, now: datetime) -> Optional[str]:
+        if self.version is None:
+            return None
+        return entity_tag(
+            TODAYS_VIEW, self.version, "races", bisect.bisect_left(self.started, now)
+        )
+
+    def upcoming(self, now: datetime) -> list[dict]:
+        if self.race_date is None:
+            return []
+        courses = []
+        for course, race_times in zip(self.courses, self.race_times):
+            start = bisect.bisect_left(race_times, now)
+            if start < len(race_times):
+                courses.append({**course, "races": course["races"][start:]})
+        return [{"race_date": self.race_date, "courses": courses}]
+
+
+todays_races_index = TodaysRacesIndex()
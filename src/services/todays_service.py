@@ -1,13 +1,39 @@
+import asyncio
+import time
 from datetime import datetime
+from typing import AsyncIterator, Callable, Optional
 
 from fastapi import Depends
 
+from ..config import config
+from ..helpers.logging_config import logger
+from ..helpers.serialization import dumps
+from ..helpers.session_manager import background_session
+from ..helpers.worker_pool import worker_pool
 from ..repository.todays_repository import TodaysRepository, get_todays_repository
-from .base_service import BaseService
+from ..repository.view_versions import view_versions
+from .base_service import (
+    BaseService,
+    build_horse_form_page,
+    build_todays_form_data,
+    encode_todays_form_table,
+    format_horse_form_page,
+    format_todays_form_data,
+    format_todays_form_table,
+)
 from .prices_service import PricesService, get_prices_service
+from .race_card_cache import race_card_cache
+from .todays_races_index import todays_races_index
 from .transformation_service import TransformationService
 import pandas as pd
 
+PRICE_FIELDS = [
+    "todays_betfair_win_sp",
+    "todays_betfair_place_sp",
+    "todays_price_change",
+]
+PRICE_STREAM_HEARTBEAT = 15
+
 
 class TodaysService(BaseService):
     todays_repository: TodaysRepository
@@ -24,45 +50,247 @@ class TodaysService(BaseService):
         self.transformation_service = transformation_service
         self.prices_service = prices_service
 
-    async def get_todays_races(self):
-        data = await self.todays_repository.get_todays_races()
-        return self.format_todays_races(data[data["race_time"] >= datetime.now()])
+    async def sync_todays_races_index(self) -> None:
+        if todays_races_index.is_stale(view_versions.todays):
+            version = await self.todays_repository.get_performance_data_version()
+            data = await self.todays_repository.get_todays_races()
+            self.index_todays_races(version, data)
 
-    async def get_race_by_id(self, race_id: int):
-        todays_data = await self.todays_repository.get_race_by_id(race_id)
+    def todays_races_tag(self, now: datetime) -> Optional[str]:
+        return todays_races_index.tag(now)
+
+    def get_todays_races(self, now: datetime) -> list[dict]:
+        return todays_races_index.upcoming(now)
+
+    def index_todays_races(self, version: str, data: pd.DataFrame) -> None:
+        todays_races_index.replace(
+            version,
+            None if data.empty else data["race_date"].iloc[0],
+            self.group_todays_races(data),
+        )
+
+    async def get_race_by_id(self, race_id: int, runs: Optional[int] = None):
+        return await self._format_race(
+            race_id, format_todays_form_data, build_todays_form_data, runs
+        )
+
+    async def get_race_table_by_id(self, race_id: int, media_type: str) -> bytes:
+        return await self._format_race(
+            race_id, format_todays_form_table, encode_todays_form_table, media_type
+        )
+
+    async def _format_race(
+        self,
+        race_id: int,
+        format_function: Callable,
+        build_function: Callable,
+        *args,
+    ):
+        race_card = race_card_cache.get(race_id)
+        if race_card is None:
+            todays_data = await self.todays_repository.get_race_by_id(race_id)
+            prices = await self.prices_service.get_current_prices()
+            data = self._merge_prices_with_data(todays_data, prices)
+            return await worker_pool.run(
+                format_function,
+                data,
+                self.transformation_service.calculate,
+                *args,
+            )
         prices = await self.prices_service.get_current_prices()
-        data = self._merge_prices_with_data(todays_data, prices)
-        return self.format_todays_form_data(
-            data,
+        data = self._merge_prices_with_data(race_card, prices).pipe(
+            self.transformation_service.round_price_data
+        )
+        return await worker_pool.run(build_function, data, *args)
+
+    async def get_horse_form(
+        self,
+        race_id: int,
+        horse_id: int,
+        cursor: Optional[tuple[pd.Timestamp, str]],
+        limit: int,
+    ) -> Optional[bytes]:
+        race_card = race_card_cache.get(race_id)
+        if race_card is not None:
+            horse_form = race_card[race_card["horse_id"] == horse_id]
+            if horse_form.empty:
+                return None
+            return await worker_pool.run(
+                build_horse_form_page, horse_form, horse_id, cursor, limit
+            )
+        todays_data = await self.todays_repository.get_race_by_id(race_id)
+        horse_form = todays_data[todays_data["horse_id"] == horse_id]
+        if horse_form.empty:
+            return None
+        return await worker_pool.run(
+            format_horse_form_page,
+            horse_form,
             self.transformation_service.calculate,
+            horse_id,
+            cursor,
+            limit,
         )
 
+    async def get_race_cards(
+        self,
+        race_ids: list[int],
+        course_id: Optional[int] = None,
+        runs: Optional[int] = None,
+    ) -> list[bytes]:
+        """
+        The encoded form data of each race card, in race order.
+
+        Cached cards only have prices merged here and are built in the
+        workers. The rest are read, transformed and built in one worker
+        call for the whole set of races.
+        """
+        prices = await self.prices_service.get_current_prices()
+        cached_race_ids = []
+        builds = []
+        if course_id is None:
+            for race_id in race_ids:
+                race_card = race_card_cache.get(race_id)
+                if race_card is not None:
+                    race_card = self._merge_prices_with_data(race_card, prices).pipe(
+                        self.transformation_service.round_price_data
+                    )
+                    cached_race_ids.append(race_id)
+                    builds.append(
+                        worker_pool.run(build_todays_form_data, race_card, runs)
+                    )
+            missing_race_ids = [r for r in race_ids if r not in cached_race_ids]
+            data = (
+                await self.todays_repository.get_races_by_ids(missing_race_ids)
+                if missing_race_ids
+                else pd.DataFrame()
+            )
+        else:
+            data = await self.todays_repository.get_races_by_course_id(course_id)
+            race_ids = missing_race_ids = (
+                []
+                if data.empty
+                else data[
+                    (data["data_type"] == "today") & (data["course_id"] == course_id)
+                ]
+                .sort_values("race_time")["race_id"]
+                .unique()
+                .tolist()
+            )
+        race_cards = dict(zip(cached_race_ids, await asyncio.gather(*builds)))
+        if not data.empty:
+            data = self._merge_prices_with_data(data, prices)
+            race_cards.update(
+                await worker_pool.run(encode_race_cards, data, missing_race_ids, runs)
+            )
+
+        return [race_cards[race_id] for race_id in race_ids if race_id in race_cards]
+
+    def prepare_race_cards(
+        self, data: pd.DataFrame, race_ids: Optional[list[int]] = None
+    ) -> dict[int, pd.DataFrame]:
+        today = data[data["data_type"] == "today"]
+        if race_ids is not None:
+            today = today[today["race_id"].isin(race_ids)]
+        data, date = self.filter_form_period(data)
+        horse_form = self.transformation_service.calculate_horse_form(data, date)
+
+        race_cards = {}
+        for race_id, runners in today.groupby("race_id"):
+            race_form = horse_form[
+                horse_form["horse_id"].isin(runners["horse_id"])
+            ].reset_index(drop=True)
+            try:
+                race_cards[int(race_id)] = self.convert_form_data_columns(
+                    self.transformation_service.calculate_race_diffs(race_form)
+                )
+            except Exception as error:
+                logger.exception(f"Failed to prepare race card {race_id}: {error}")
+        return race_cards
+
+    async def get_race_runners(self, race_id: int) -> pd.DataFrame:
+        race_card = race_card_cache.get(race_id)
+        if race_card is not None:
+            runners = race_card[race_card["data_type"] == "today"]
+            return runners[["horse_id", "horse_name", "betfair_id"]]
+        return await self.todays_repository.get_race_runners(race_id)
+
+    async def stream_race_prices(
+        self, race_id: int, runners: pd.DataFrame
+    ) -> AsyncIterator[bytes]:
+        """
+        Server-sent events with the race's prices as shown on the race card.
+
+        The first event is a snapshot of every runner, and after that only
+        the fields that changed since the last event are sent per runner.
+        A comment line is sent as a heartbeat while the prices are unchanged.
+        """
+        sent: dict[int, dict] = {}
+        source = None
+        event_id = 0
+        last_sent = time.monotonic()
+        while True:
+            prices = await self.prices_service.get_current_prices()
+            if prices is not source:
+                source = prices
+                current = self.get_race_prices(runners, prices)
+                changes = self._price_changes(sent, current)
+                if changes:
+                    event = "snapshot" if not sent else "prices"
+                    data = dumps({"race_id": race_id, "runners": changes})
+                    event_id += 1
+                    sent = current
+                    last_sent = time.monotonic()
+                    yield (
+                        f"id: {event_id}\nevent: {event}\ndata: ".encode()
+                        + data
+                        + b"\n\n"
+                    )
+            if time.monotonic() - last_sent >= PRICE_STREAM_HEARTBEAT:
+                last_sent = time.monotonic()
+                yield b": heartbeat\n\n"
+            await asyncio.sleep(config.prices_refresh_interval)
+
+    def get_race_prices(
+        self, runners: pd.DataFrame, prices: pd.DataFrame
+    ) -> dict[int, dict]:
+        data = runners.join(
+            prices[["betfair_win_sp", "betfair_place_sp", "price_change"]],
+            on="betfair_id",
+        ).pipe(self.transformation_service.round_price_data)
+        data = data.assign(
+            todays_betfair_win_sp=data["betfair_win_sp"],
+            todays_betfair_place_sp=data["betfair_place_sp"],
+            todays_price_change=data["price_change"].fillna(0).round(0).astype(int),
+        )
+        data = data[["horse_id", *PRICE_FIELDS]].astype(object)
+        records = data.where(data.notna(), None).to_dict(orient="records")
+        return {int(record["horse_id"]): record for record in records}
+
+    @staticmethod
+    def _price_changes(sent: dict[int, dict], current: dict[int, dict]) -> list[dict]:
+        changes = []
+        for horse_id, prices in current.items():
+            previous = sent.get(horse_id, {})
+            changed = {
+                field: prices[field]
+                for field in PRICE_FIELDS
+                if field not in previous or previous[field] != prices[field]
+            }
+            if changed:
+                changes.append({"horse_id": horse_id, **changed})
+        return changes
+
     def _merge_prices_with_data(
         self, data: pd.DataFrame, prices: pd.DataFrame
     ) -> pd.DataFrame:
         today = data[data["data_type"] == "today"]
         hist = data[~(data["data_type"] == "today")].assign(betfair_id=None)
 
-        prices = prices.rename(columns={"horse_id": "betfair_id"})
-
-        today = (
-            today.merge(prices, left_on="betfair_id", right_on="betfair_id", how="left")
-            .drop(
-                columns=[
-                    "betfair_win_sp_x",
-                    "betfair_place_sp_x",
-                    "market_id_win",
-                    "market_id_place",
-                    "price_change_x",
-                ]
-            )
-            .rename(
-                columns={
-                    "betfair_win_sp_y": "betfair_win_sp",
-                    "betfair_place_sp_y": "betfair_place_sp",
-                    "price_change_y": "price_change",
-                }
-            )
+        today = today.drop(
+            columns=["betfair_win_sp", "betfair_place_sp", "price_change"]
+        ).join(
+            prices[["betfair_win_sp", "betfair_place_sp", "price_change"]],
+            on="betfair_id",
         )
 
         data = pd.concat([hist, today]).reset_index(drop=True)
@@ -75,3 +303,28 @@ def get_todays_service(
 ):
     transformation_service = TransformationService()
     return TodaysService(todays_repository, transformation_service, prices_service)
+
+
+def encode_race_cards(
+    data: pd.DataFrame, race_ids: list[int], runs: Optional[int] = None
+) -> dict[int, bytes]:
+    service = TodaysService(None, TransformationService(), None)
+    return {
+        race_id: dumps(service.build_todays_form_data(race_card, runs))
+        for race_id, race_card in service.prepare_race_cards(data, race_ids).items()
+    }
+
+
+async def refresh_race_card_cache():
+    async with background_session() as session:
+        todays_repository = TodaysRepository(session)
+        version = await todays_repository.get_performance_data_version()
+        if version == race_card_cache.version:
+            return
+        data = await todays_repository.get_todays_performance_data()
+        todays_races = await todays_repository.get_todays_races()
+    service = TodaysService(todays_repository, TransformationService(), None)
+    service.index_todays_races(version, todays_races)
+    race_cards = await asyncio.to_thread(service.prepare_race_cards, data)
+    race_card_cache.replace(version, race_cards)
+    logger.info(f"Race card cache refreshed with {len(race_cards)} races")
@@ -1,8 +1,36 @@
-import re
+from typing import Optional
 
 import numpy as np
 import pandas as pd
 
+from ..helpers.timing import timed
+
+AGE_RANGE_PATTERN = r"(?P<age_range>\d+yo\+?)|(\d+-(?P<max_rating>\d+))"
+
+RATINGS_BANDS: dict[str, tuple[Optional[str], int]] = {}
+
+CALCULATED_COLUMNS = [
+    "days_since_performance",
+    "weeks_since_performance",
+    "days_since_last_ran",
+    "weeks_since_last_ran",
+    "number_of_runs",
+    "first_places",
+    "second_places",
+    "third_places",
+    "fourth_places",
+    "distance_diff",
+    "rating",
+    "speed_figure",
+    "rank",
+    "median_speed",
+    "median_rating",
+    "rating_diff",
+    "speed_rating_diff",
+    "class_diff",
+    "rating_range_diff",
+]
+
 
 class TransformationService:
     def __init__(self):
@@ -82,23 +110,42 @@ class TransformationService:
 
     @staticmethod
     def _calculate_ratings_bands(data: pd.DataFrame) -> pd.DataFrame:
-        def extract_age_and_max_rating(text):
-            age_range_pattern = r"(\d+yo\+?)|(\d+-(\d+))"
-            matches = re.findall(age_range_pattern, text)
-            age_range = next((match[0] for match in matches if match[0]), None)
-            max_rating = next((match[2] for match in matches if match[2]), None)
-            return pd.Series({"age_range": age_range, "max_rating": max_rating})
-
-        data[["age_range", "hcap_range"]] = data["conditions"].apply(
-            extract_age_and_max_rating
+        """
+        Parse age_range and hcap_range once per distinct conditions string.
+
+        Parsed strings are kept in RATINGS_BANDS, so only conditions not
+        seen before are run through the regex; every row is then filled by
+        indexing the parsed values with the factorized conditions codes.
+        """
+        codes, conditions = pd.factorize(data["conditions"])
+        TransformationService._parse_ratings_bands(
+            [c for c in conditions if c not in RATINGS_BANDS]
         )
+        bands = [RATINGS_BANDS[c] for c in conditions] + [(None, 0)]
+        age_ranges = np.array([age_range for age_range, _ in bands], dtype=object)
+        hcap_ranges = np.array([hcap_range for _, hcap_range in bands], dtype=int)
 
-        data["hcap_range"] = (
-            pd.to_numeric(data["hcap_range"], errors="coerce").fillna(0).astype(int)
-        )
+        data["age_range"] = age_ranges[codes]
+        data["hcap_range"] = hcap_ranges[codes]
 
         return data
 
+    @staticmethod
+    def _parse_ratings_bands(conditions: list[str]) -> None:
+        if not conditions:
+            return
+        matches = pd.Series(conditions, dtype=object).str.extractall(AGE_RANGE_PATTERN)
+        by_condition = matches.groupby(level=0)
+        age_ranges = by_condition["age_range"].first()
+        hcap_ranges = pd.to_numeric(by_condition["max_rating"].first(), errors="coerce")
+        for i, condition in enumerate(conditions):
+            age_range = age_ranges.get(i)
+            hcap_range = hcap_ranges.get(i)
+            RATINGS_BANDS[condition] = (
+                None if pd.isna(age_range) else age_range,
+                0 if pd.isna(hcap_range) else int(hcap_range),
+            )
+
     @staticmethod
     def _calculate_rating_diffs(data: pd.DataFrame) -> pd.DataFrame:
         return data.assign(
@@ -114,17 +161,13 @@ class TransformationService:
 
     @staticmethod
     def _round_price_data(data: pd.DataFrame) -> pd.DataFrame:
-        def custom_round(x):
-            if x is None:
-                return None
-            if abs(x) >= 10:
-                return round(x)
-            else:
-                return round(x, 1)
-
         return data.assign(
-            betfair_win_sp=data["betfair_win_sp"].apply(custom_round),
-            betfair_place_sp=data["betfair_place_sp"].apply(custom_round),
+            betfair_win_sp=data["betfair_win_sp"].apply(
+                TransformationService._custom_round
+            ),
+            betfair_place_sp=data["betfair_place_sp"].apply(
+                TransformationService._custom_round
+            ),
         )
 
     @staticmethod
@@ -288,8 +331,273 @@ class TransformationService:
 
         return data
 
+    @staticmethod
+    def _group_starts(keys: np.ndarray) -> np.ndarray:
+        starts = np.ones(len(keys), dtype=bool)
+        starts[1:] = keys[1:] != keys[:-1]
+        return starts
+
+    @staticmethod
+    def _group_cumsum(values: np.ndarray, starts: np.ndarray) -> np.ndarray:
+        totals = np.cumsum(values, dtype=np.int64)
+        start_positions = np.flatnonzero(starts)
+        offsets = totals[start_positions] - values[start_positions]
+        return totals - np.repeat(
+            offsets, np.diff(np.append(start_positions, len(values)))
+        )
+
+    @staticmethod
+    def _shift_within_groups(
+        values: np.ndarray, starts: np.ndarray, fill_value
+    ) -> np.ndarray:
+        shifted = np.empty_like(values)
+        shifted[1:] = values[:-1]
+        shifted[starts] = fill_value
+        return shifted
+
+    @staticmethod
+    def _combine_ratings(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        combined = np.where(
+            np.isnan(first) & ~np.isnan(second),
+            second,
+            np.where(
+                np.isnan(second) & ~np.isnan(first),
+                first,
+                (first + second) / 2,
+            ),
+        )
+        return np.round(np.nan_to_num(combined, nan=0.0)).astype(int)
+
+    @staticmethod
+    def _group_medians(
+        group_ids: np.ndarray, values: np.ndarray, groups: int
+    ) -> np.ndarray:
+        """
+        Median of the integer values in each group, NaN for empty groups.
+
+        Group and value are packed into one int64 key, so a single sort
+        orders the values within each group and the medians are read from
+        the middle of every group.
+        """
+        medians = np.full(groups, np.nan)
+        if len(values) == 0:
+            return medians
+        low = values.min()
+        span = np.int64(values.max() - low + 1)
+        keys = np.sort(group_ids.astype(np.int64) * span + (values - low))
+        ordered = (keys % span + low).astype(float)
+        counts = np.bincount(group_ids, minlength=groups)
+        starts = np.cumsum(counts) - counts
+        present = counts > 0
+        lower = (starts + (counts - 1) // 2)[present]
+        upper = (starts + counts // 2)[present]
+        medians[present] = (ordered[lower] + ordered[upper]) / 2
+        return medians
+
+    @staticmethod
+    def _horse_ratings(
+        groups: int,
+        group_ids: np.ndarray,
+        speed_figure: np.ndarray,
+        rating: np.ndarray,
+    ) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Median and mean speed figure and rating of each horse's recent runs,
+        NaN for horses without any.
+        """
+        counts = np.bincount(group_ids, minlength=groups)
+        with np.errstate(invalid="ignore"):
+            mean_speed = np.bincount(group_ids, speed_figure, minlength=groups) / counts
+            mean_rating = np.bincount(group_ids, rating, minlength=groups) / counts
+        return (
+            TransformationService._group_medians(group_ids, speed_figure, groups),
+            TransformationService._group_medians(group_ids, rating, groups),
+            mean_speed,
+            mean_rating,
+        )
+
+    @staticmethod
+    def _round_prices(prices: pd.Series) -> pd.Series:
+        if prices.dtype.kind != "f":
+            return prices.apply(TransformationService._custom_round)
+        codes, uniques = pd.factorize(prices)
+        rounded = pd.Series(
+            [TransformationService._custom_round(x) for x in uniques.tolist()],
+            dtype=None if len(uniques) else float,
+        ).to_numpy()
+        if (codes == -1).any():
+            rounded = np.append(rounded.astype(float), np.nan)
+        return pd.Series(rounded[codes], index=prices.index, name=prices.name)
+
+    @staticmethod
+    def _custom_round(x):
+        if x is None:
+            return None
+        if abs(x) >= 10:
+            return round(x)
+        else:
+            return round(x, 1)
+
     @staticmethod
     def calculate(data: pd.DataFrame, date: str) -> pd.DataFrame:
+        return TransformationService.calculate_race_diffs(
+            TransformationService.calculate_horse_form(data, date)
+        )
+
+    @staticmethod
+    @timed("horse_form")
+    def calculate_horse_form(data: pd.DataFrame, date: str) -> pd.DataFrame:
+        """
+        Single sort, single groupby equivalent of the per-horse pipeline stages.
+
+        Rows are ordered once by horse and race time and every per-horse
+        feature is derived from contiguous NumPy slices. Falls back to the
+        stage pipeline when the history has missing keys or race dates that
+        disagree with race times, where the two orderings would differ.
+
+        Nothing here depends on which race is today's, so one call can serve
+        every race on a card before calculate_race_diffs is applied per race.
+        """
+        sorted_data = data.sort_values(
+            by=["horse_id", "race_time", "race_date"]
+        ).reset_index(drop=True)
+        race_dates = pd.to_datetime(sorted_data["race_date"], errors="coerce")
+        race_times = pd.to_datetime(sorted_data["race_time"])
+        horse_ids = sorted_data["horse_id"].to_numpy()
+        starts = TransformationService._group_starts(horse_ids)
+
+        date_days = race_dates.to_numpy(dtype="datetime64[D]").astype(np.int64)
+        day_gaps = np.diff(date_days, prepend=date_days[:1])
+        if (
+            sorted_data["horse_id"].isna().any()
+            or race_dates.isna().any()
+            or race_times.isna().any()
+            or (day_gaps[~starts] < 0).any()
+        ):
+            return TransformationService._calculate_horse_form_pipeline(data, date)
+
+        group_ids = np.cumsum(starts) - 1
+        start_positions = np.flatnonzero(starts)
+        is_today = (sorted_data["data_type"] == "today").to_numpy()
+        todays_row = sorted_data[is_today].iloc[0]
+
+        days_since_last_ran = pd.Series(pd.arrays.IntegerArray(day_gaps, starts.copy()))
+        days_since_performance = (pd.to_datetime(date) - race_dates).dt.days
+
+        previous_position = TransformationService._shift_within_groups(
+            sorted_data["finishing_position"].to_numpy(dtype=object), starts, "0"
+        )
+        number_of_runners = sorted_data["number_of_runners"].to_numpy(
+            dtype=float, na_value=np.nan
+        )
+
+        def as_float(column: str) -> np.ndarray:
+            return sorted_data[column].to_numpy(dtype=float, na_value=np.nan)
+
+        rating = TransformationService._combine_ratings(
+            as_float("tfr"), as_float("rpr")
+        )
+        speed_figure = TransformationService._combine_ratings(
+            as_float("ts"), as_float("tfig")
+        )
+
+        new_date = starts | (day_gaps != 0)
+        distinct_dates = TransformationService._group_cumsum(new_date, starts)
+        group_ends = np.append(start_positions[1:], len(sorted_data)) - 1
+        rank = (distinct_dates[group_ends][group_ids] - distinct_dates + 1).astype(
+            float
+        )
+
+        two_years_ago = pd.to_datetime(todays_row["race_date"]) - pd.DateOffset(years=2)
+        recent = (
+            (race_times >= two_years_ago).to_numpy()
+            & (rank <= 5)
+            & (speed_figure >= 15)
+            & (rating >= 15)
+        )
+        horse_ratings = TransformationService._horse_ratings(
+            len(start_positions),
+            group_ids[recent],
+            speed_figure[recent],
+            rating[recent],
+        )
+        median_speed, median_rating, mean_speed, mean_rating = (
+            values[group_ids] for values in horse_ratings
+        )
+        todays_speed = (median_speed + mean_speed) / 2
+        todays_rating = (median_rating + mean_rating) / 2
+        speed_figure = np.round(
+            np.nan_to_num(np.where(is_today, todays_speed, speed_figure), nan=0.0)
+        ).astype(int)
+        rating = np.round(
+            np.nan_to_num(np.where(is_today, todays_rating, rating), nan=0.0)
+        ).astype(int)
+
+        def diff_to_median(values: np.ndarray, medians: np.ndarray) -> np.ndarray:
+            return np.nan_to_num(np.round(values - medians), nan=0.0).astype(int)
+
+        data = sorted_data.assign(
+            days_since_performance=days_since_performance,
+            weeks_since_performance=days_since_performance // 7,
+            days_since_last_ran=days_since_last_ran,
+            weeks_since_last_ran=days_since_last_ran // 7,
+            number_of_runs=np.arange(len(sorted_data)) - start_positions[group_ids],
+            first_places=TransformationService._group_cumsum(
+                previous_position == "1", starts
+            ),
+            second_places=TransformationService._group_cumsum(
+                previous_position == "2", starts
+            ),
+            third_places=TransformationService._group_cumsum(
+                (previous_position == "3") & (number_of_runners > 7), starts
+            ),
+            fourth_places=TransformationService._group_cumsum(
+                (previous_position == "4") & (number_of_runners > 12), starts
+            ),
+            rating=rating,
+            speed_figure=speed_figure,
+            rank=rank,
+            race_time=race_times,
+            median_speed=median_speed,
+            median_rating=median_rating,
+            rating_diff=diff_to_median(rating, median_rating),
+            speed_rating_diff=diff_to_median(speed_figure, median_speed),
+            betfair_win_sp=TransformationService._round_prices(
+                sorted_data["betfair_win_sp"]
+            ),
+            betfair_place_sp=TransformationService._round_prices(
+                sorted_data["betfair_place_sp"]
+            ),
+        )
+
+        return data.pipe(TransformationService._calculate_ratings_bands)
+
+    @staticmethod
+    @timed("race_diffs")
+    def calculate_race_diffs(data: pd.DataFrame) -> pd.DataFrame:
+        return (
+            data.pipe(TransformationService._create_distance_diff)
+            .pipe(TransformationService._create_class_diff)
+            .pipe(TransformationService._create_rating_range_diff)
+            .pipe(TransformationService._order_calculated_columns)
+        )
+
+    @staticmethod
+    def _order_calculated_columns(data: pd.DataFrame) -> pd.DataFrame:
+        calculated = set(CALCULATED_COLUMNS)
+        return data[
+            [column for column in data.columns if column not in calculated]
+            + CALCULATED_COLUMNS
+        ]
+
+    @staticmethod
+    def calculate_pipeline(data: pd.DataFrame, date: str) -> pd.DataFrame:
+        return TransformationService.calculate_race_diffs(
+            TransformationService._calculate_horse_form_pipeline(data, date)
+        )
+
+    @staticmethod
+    def _calculate_horse_form_pipeline(data: pd.DataFrame, date: str) -> pd.DataFrame:
         data = (
             TransformationService._create_tmp_vars(data, date)
             .pipe(TransformationService._sort_data)
@@ -297,7 +605,6 @@ class TransformationService:
             .pipe(TransformationService._create_days_since_last_ran)
             .pipe(TransformationService._create_number_of_runs)
             .pipe(TransformationService._calculate_places)
-            .pipe(TransformationService._create_distance_diff)
             .pipe(TransformationService._calculate_combined_ratings)
             .pipe(TransformationService._create_todays_rating)
             .pipe(TransformationService._fill_todays_rating)
@@ -305,12 +612,14 @@ class TransformationService:
             .pipe(TransformationService._round_price_data)
             .pipe(TransformationService._cleanup_temp_vars)
             .pipe(TransformationService._calculate_ratings_bands)
-            .pipe(TransformationService._create_class_diff)
-            .pipe(TransformationService._create_rating_range_diff)
         )
 
         return data
 
+    @timed("round_prices")
+    def round_price_data(self, data: pd.DataFrame) -> pd.DataFrame:
+        return TransformationService._round_price_data(data)
+
     def transform_collateral_form_data(self, data: pd.DataFrame) -> pd.DataFrame:
         data = TransformationService._calculate_combined_ratings(data)
         return data